@@ -1,5 +1,9 @@
 import socket
+import selectors
+import codecs
+import hashlib
 import json
+import re
 import threading
 import tkinter as tk
 from tkinter import ttk, messagebox
@@ -11,10 +15,26 @@ import os
 import traceback
 import sys
 import ctypes
+from collections import deque
 
 API_BASE_URL = "https://lds-7e2n.onrender.com"
 TCP_PORT = 7000
 TIMEOUT_SECONDS = 5
+POST_TIMEOUT_SECONDS = 10
+SEND_QUEUE_SIZE = 32
+# Queued submits posted together to /submit/{club}/batch, at most
+SEND_BATCH_SIZE = 200
+JOURNAL_MAX_ENTRIES = 500
+RETRY_SECONDS = 5
+TCP_BACKLOG = 16
+FRAME_DELIMITER = "\x05"
+FRAME_IDLE_SECONDS = 0.2
+RACE_PATTERN = re.compile(r"Race:\s*(\d+)")
+# A LayoutDraw command and its Key=Value; fields, e.g. Command=LayoutDraw;Clear=2;
+LAYOUT_DRAW_PREFIX = "Command=LayoutDraw;"
+LAYOUT_DRAW = re.compile(r"Command=LayoutDraw;(?:\w+=[^;\x05\r\n]*;)*")
+# What may follow a command while its next field is still arriving
+LAYOUT_DRAW_PARTIAL = re.compile(r"\w*(?:=[^;\x05\r\n]*)?\s*")
 
 def resource_path(relative_path):
     try:
@@ -36,6 +56,396 @@ def get_user_data_path(filename):
 
 CONFIG_FILE = get_user_data_path("config.json")
 LOG_FILE = get_user_data_path("error.log")
+JOURNAL_FILE = get_user_data_path("outbox.jsonl")
+
+def frame_key(payload):
+    """What a submit's frame sets on the server, or None if it only carries the form fields.
+
+    Mirrors the server's parser: a frame with "Race: <n>" sets race n and its
+    runners, one ending in \x05 without it sets the margins message.
+    """
+    raw = payload.get("raw_message", "")
+    if "Race:" in raw:
+        race = RACE_PATTERN.search(raw.replace("\r", ""))
+        return ("race", race.group(1)) if race else None
+    if raw.endswith(FRAME_DELIMITER):
+        return ("message",)
+    return None
+
+def supersedes(newer, older):
+    """True if submitting newer makes sending older pointless.
+
+    Every submit carries the whole form, so only what older's frame set can
+    be lost: that is safe when newer's frame sets the same thing.
+    """
+    older_key = frame_key(older)
+    return older_key is None or older_key == frame_key(newer)
+
+def batch_length(jobs):
+    """How many of jobs, a list of (path, payload), can go out from the front as one request."""
+    path, payload = jobs[0]
+    if payload is None:
+        return 1
+    count = 1
+    while count < min(len(jobs), SEND_BATCH_SIZE) and jobs[count][0] == path and jobs[count][1] is not None:
+        count += 1
+    return count
+
+class OfflineJournal:
+    """Append-only file of updates that couldn't reach the server, oldest first.
+
+    Only the sender's worker thread touches it.
+    """
+
+    def __init__(self, path=JOURNAL_FILE, max_entries=JOURNAL_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.count = len(self.load())
+
+    def __len__(self):
+        return self.count
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return []
+        entries = []
+        with open(self.path, "r") as f:
+            for line in f:
+                try:
+                    entries.append(json.loads(line))
+                except ValueError:
+                    continue  # a line torn by a crash mid-append
+        return entries
+
+    def append(self, path, payload):
+        with open(self.path, "a") as f:
+            f.write(json.dumps({"path": path, "payload": payload}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        self.count += 1
+        if self.count > self.max_entries:
+            self.rewrite(self.compact(self.load())[-self.max_entries:])
+
+    def rewrite(self, entries):
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w") as f:
+            for entry in entries:
+                f.write(json.dumps(entry) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+        self.count = len(entries)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        self.count = 0
+
+    @staticmethod
+    def compact(entries):
+        """Drop the submits a later entry supersedes, keeping everything else in order.
+
+        One pass from the newest: each club keeps its last race result per
+        race and its last margins message; initialise commands all stay.
+        """
+        # {path: frame keys set by later submits}
+        later = {}
+        kept = []
+        for entry in reversed(entries):
+            payload = entry["payload"]
+            if payload is not None:
+                key = frame_key(payload)
+                keys = later.setdefault(entry["path"], set())
+                if keys and (key is None or key in keys):
+                    continue
+                keys.add(key)
+            kept.append(entry)
+        kept.reverse()
+        return kept
+
+class OutboundSender:
+    """Posts updates to the server from one worker thread over a keep-alive session.
+
+    Callers never wait on the network. A queued submit that hasn't gone out
+    yet is dropped once a newer one supersedes it; the rest of a backlog goes
+    out in order as one /batch request, so the server folds every frame.
+    Initialise commands keep their place in the order.
+
+    While the server is unreachable updates go to the offline journal instead,
+    and the journal is replayed every RETRY_SECONDS until it gets through.
+    """
+
+    def __init__(self, base_url=API_BASE_URL, journal=None):
+        self.base_url = base_url
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=1, pool_maxsize=2)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        self.queue = deque()
+        self.condition = threading.Condition()
+        self.running = True
+        self.sent = 0
+        self.collapsed = 0
+        self.dropped = 0
+        self.throttled = 0
+        self.last_latency = None
+        self.journal = journal if journal is not None else OfflineJournal()
+        # Anything left from a previous session goes out before new updates
+        self.offline = len(self.journal) > 0
+        self.next_retry = time.time()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+
+    def enqueue(self, path, payload=None, error_tag="POST ERROR"):
+        job = (path, payload, error_tag, time.time())
+        with self.condition:
+            if payload is not None:
+                # Stale intermediate states: only the newest needs to reach the server
+                kept = deque(queued for queued in self.queue
+                             if queued[0] != path or queued[1] is None or not supersedes(payload, queued[1]))
+                self.collapsed += len(self.queue) - len(kept)
+                self.queue = kept
+            self.queue.append(job)
+            if len(self.queue) > SEND_QUEUE_SIZE:
+                self.queue.popleft()
+                self.dropped += 1
+            self.condition.notify()
+
+    def unsent(self, path, payload):
+        """payload minus what queued submits for path supersede, or None if nothing is left.
+
+        payload is one submit or a list of them.
+        """
+        with self.condition:
+            newer = [job[1] for job in self.queue if job[0] == path and job[1] is not None]
+        if isinstance(payload, list):
+            left = [older for older in payload if not any(supersedes(queued, older) for queued in newer)]
+            return left or None
+        return None if any(supersedes(queued, payload) for queued in newer) else payload
+
+    def deliver(self, path, payload):
+        """Post one update, or a list of submits for path as one batch.
+
+        Returns False if the server couldn't be reached.
+        """
+        url = f"{self.base_url}{path}/batch" if isinstance(payload, list) else f"{self.base_url}{path}"
+        while True:
+            try:
+                response = self.session.post(url, json=payload, timeout=POST_TIMEOUT_SECONDS)
+            except (requests.ConnectionError, requests.Timeout):
+                return False
+            if response.status_code != 429:
+                break
+            # Server is rate limiting this club: wait, then resend only what no queued submit replaces
+            self.throttled += 1
+            try:
+                wait = float(response.headers.get("Retry-After", RETRY_SECONDS))
+            except ValueError:
+                wait = RETRY_SECONDS
+            time.sleep(min(wait, RETRY_SECONDS))
+            if payload is not None:
+                payload = self.unsent(path, payload)
+                if payload is None:
+                    return True
+        if response.status_code >= 500:
+            return False
+        response.raise_for_status()
+        self.sent += len(payload) if isinstance(payload, list) else 1
+        return True
+
+    def go_offline(self, error_tag):
+        if not self.offline:
+            with open(LOG_FILE, "a") as log:
+                log.write(f"[{error_tag}] {datetime.now().isoformat()} server unreachable, journalling updates\n")
+        self.offline = True
+        self.next_retry = time.time() + RETRY_SECONDS
+
+    def flush_journal(self):
+        """Replay journalled updates in order, minus the ones a later entry supersedes.
+
+        Runs of submits go out through the batch endpoint, so the server folds
+        every frame. Returns how many were delivered.
+        """
+        entries = OfflineJournal.compact(self.journal.load())
+        jobs = [(entry["path"], entry["payload"]) for entry in entries]
+        done = 0
+        while done < len(jobs):
+            count = batch_length(jobs[done:])
+            path, payload = jobs[done]
+            if count > 1:
+                payload = [queued for _, queued in jobs[done:done + count]]
+            try:
+                delivered = self.deliver(path, payload)
+            except Exception:
+                delivered = True  # rejected by the server; retrying won't help
+                with open(LOG_FILE, "a") as log:
+                    log.write(f"[REPLAY ERROR] {datetime.now().isoformat()}\n")
+                    traceback.print_exc(file=log)
+            if not delivered:
+                self.journal.rewrite(entries[done:])
+                self.go_offline("REPLAY ERROR")
+                return done
+            done += count
+        self.journal.clear()
+        self.offline = False
+        return len(entries)
+
+    def journal_all(self, jobs):
+        for path, payload, _, _ in jobs:
+            self.journal.append(path, payload)
+
+    def retry_due(self):
+        return self.offline and time.time() >= self.next_retry
+
+    def run(self):
+        while True:
+            with self.condition:
+                while self.running and not self.queue and not self.retry_due():
+                    self.condition.wait(max(0, self.next_retry - time.time()) if self.offline else None)
+                if not self.queue and not self.retry_due():
+                    return
+                batch = []
+                if self.queue:
+                    count = batch_length([(queued[0], queued[1]) for queued in self.queue])
+                    batch = [self.queue.popleft() for _ in range(count)]
+            if batch:
+                path, payload, error_tag, queued_at = batch[0]
+                if len(batch) > 1:
+                    payload = [queued[1] for queued in batch]
+                if self.offline:
+                    self.journal_all(batch)
+                else:
+                    try:
+                        if self.deliver(path, payload):
+                            self.last_latency = time.time() - queued_at
+                        else:
+                            self.journal_all(batch)
+                            self.go_offline(error_tag)
+                    except Exception:
+                        with open(LOG_FILE, "a") as log:
+                            log.write(f"[{error_tag}] {datetime.now().isoformat()}\n")
+                            traceback.print_exc(file=log)
+            if self.retry_due():
+                self.flush_journal()
+
+    def stop(self):
+        with self.condition:
+            self.running = False
+            self.condition.notify()
+        self.thread.join(timeout=POST_TIMEOUT_SECONDS)
+        self.session.close()
+
+class FrameAssembler:
+    """Rebuilds LSD frames from one TCP connection's byte stream.
+
+    A frame ends at \x05 (kept, since the server uses it to spot message-only
+    frames). A LayoutDraw command is a frame of its own, whatever follows it
+    on the wire. Text left over when the peer closes, or after
+    FRAME_IDLE_SECONDS without new bytes, is a frame too.
+    """
+
+    def __init__(self):
+        self.decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+        self.buffer = ""
+        self.last_data = time.time()
+
+    def feed(self, chunk):
+        self.buffer += self.decoder.decode(chunk)
+        self.last_data = time.time()
+        return self.split(final=False)
+
+    def split(self, final):
+        """Cut the complete frames off the front of the buffer.
+
+        A command at the end of the buffer may still be growing, so it waits
+        for more bytes unless final is set.
+        """
+        frames = []
+        while True:
+            end = self.buffer.find(FRAME_DELIMITER)
+            command = self.buffer.find(LAYOUT_DRAW_PREFIX)
+            if command == -1 or (end != -1 and end < command):
+                if end == -1:
+                    return frames
+                frames.append(self.buffer[:end + 1])
+                self.buffer = self.buffer[end + 1:]
+                continue
+            if self.buffer[:command].strip():
+                # Whatever came before the command had no delimiter; it ends here
+                frames.append(self.buffer[:command])
+            self.buffer = self.buffer[command:]
+            match = LAYOUT_DRAW.match(self.buffer)
+            rest = self.buffer[match.end():]
+            if not final and LAYOUT_DRAW_PARTIAL.fullmatch(rest):
+                return frames
+            # A delimiter straight after the command belongs to it
+            after = rest.lstrip()
+            end = match.end()
+            if after.startswith(FRAME_DELIMITER):
+                end += len(rest) - len(after) + 1
+            frames.append(self.buffer[:end])
+            self.buffer = self.buffer[end:]
+
+    def flush(self):
+        self.buffer += self.decoder.decode(b"", final=True)
+        frames = self.split(final=True)
+        frame, self.buffer = self.buffer, ""
+        return frames + [frame] if frame.strip() else frames
+
+    def flush_if_idle(self):
+        if self.buffer and time.time() - self.last_data >= FRAME_IDLE_SECONDS:
+            return self.flush()
+        return []
+
+class FrameListener:
+    """Accepts timing-system connections on a listening socket and reassembles their frames.
+
+    One selector serves every connection, so there is no per-connection
+    thread; poll() returns frames in the order they complete.
+    """
+
+    def __init__(self, server_socket):
+        server_socket.setblocking(False)
+        self.server_socket = server_socket
+        self.selector = selectors.DefaultSelector()
+        self.selector.register(server_socket, selectors.EVENT_READ, None)
+
+    def poll(self, timeout=FRAME_IDLE_SECONDS):
+        frames = []
+        for key, _ in self.selector.select(timeout=timeout):
+            if key.data is None:
+                try:
+                    client_socket, addr = self.server_socket.accept()
+                except OSError:
+                    continue  # the client gave up before we got to it
+                client_socket.setblocking(False)
+                self.selector.register(client_socket, selectors.EVENT_READ, FrameAssembler())
+                continue
+
+            client_socket, assembler = key.fileobj, key.data
+            try:
+                chunk = client_socket.recv(65536)
+            except BlockingIOError:
+                continue
+            except OSError:
+                chunk = b""
+            if chunk:
+                frames.extend(assembler.feed(chunk))
+            else:
+                self.selector.unregister(client_socket)
+                client_socket.close()
+                frames.extend(assembler.flush())
+
+        for key in list(self.selector.get_map().values()):
+            if key.data is not None:
+                frames.extend(key.data.flush_if_idle())
+        return frames
+
+    def close(self):
+        for key in list(self.selector.get_map().values()):
+            if key.data is not None:
+                key.fileobj.close()
+        self.selector.close()
 
 class LoginWindow:
     def __init__(self, root, on_success):
@@ -110,11 +520,15 @@ class LSDConnect:
         self.running = True
         self.last_update_time = time.time()
         self.latest_raw_message = ""
+        self.latest_frame = ""
+        self.last_submit_digest = None
+        self.suppressed_submits = 0
         self.correct_weight = False
         self.track_condition = "Good 4"
         self.message1 = ""
         self.message2 = ""
         self.selected_venue = tk.StringVar(value=self.venues[0] if self.venues else "")
+        self.sender = OutboundSender()
         try:
             logo_path = resource_path("logo.png")
             self.logo = Image.open(logo_path).resize((350, 100))
@@ -133,7 +547,7 @@ class LSDConnect:
         ttk.Label(venue_frame, text="Venue:").pack(side="left")
         self.venue_menu = ttk.Combobox(venue_frame, textvariable=self.selected_venue, values=self.venues, state="readonly")
         self.venue_menu.pack(side="left", padx=5)
-        ttk.Button(venue_frame, text="Update", command=self.save_json).pack(side="left")
+        ttk.Button(venue_frame, text="Update", command=lambda: self.save_json(force=True)).pack(side="left")
         cond_frame = ttk.Frame(root)
         cond_frame.pack(pady=2)
         ttk.Label(cond_frame, text="Track Condition:").pack(side="left")
@@ -184,7 +598,26 @@ class LSDConnect:
             self.cw_status.set("No")
             self.cw_value_label.config(fg="red")
 
-    def save_json(self):
+    def state_digest(self):
+        """Hash of everything a submit carries, minus the timestamps added on receipt."""
+        state = [
+            self.selected_venue.get(),
+            self.message1,
+            self.message2,
+            self.track_condition,
+            self.correct_weight,
+            self.latest_frame,
+        ]
+        return hashlib.sha256(json.dumps(state).encode()).hexdigest()
+
+    def save_json(self, force=False):
+        # Timing systems re-send identical layouts; don't make the server redo them
+        digest = self.state_digest()
+        if not force and digest == self.last_submit_digest:
+            self.suppressed_submits += 1
+            return
+        self.last_submit_digest = digest
+
         data = {
             "timestamp": datetime.now().isoformat(),
             "club_id": self.club_id,
@@ -196,56 +629,58 @@ class LSDConnect:
             "correct_weight": "Yes" if self.correct_weight else "No",
             "raw_message": self.latest_raw_message
         }
-        try:
-            requests.post(f"{API_BASE_URL}/submit/{self.club_id}", json=data)
-        except Exception as e:
-            with open(LOG_FILE, "a") as log:
-                log.write(f"[POST ERROR] {datetime.now().isoformat()}\n")
-                traceback.print_exc(file=log)
+        self.sender.enqueue(f"/submit/{self.club_id}", data)
 
     def listen_tcp(self):
         try:
             server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
             server_socket.bind(("0.0.0.0", TCP_PORT))
-            server_socket.listen(1)
+            server_socket.listen(TCP_BACKLOG)
             self.status_label.config(text=f"Listening on TCP {TCP_PORT}", foreground="green")
         except Exception as e:
             self.status_label.config(text=f"Socket Error: {e}", foreground="red")
             return
 
+        # Frames are handled on this thread in the order they complete
+        listener = FrameListener(server_socket)
         while self.running:
             try:
-                client_socket, addr = server_socket.accept()
-                with client_socket:
-                    data = client_socket.recv(4096).decode(errors="replace").strip()
-                    if not data:
-                        continue
-
-                    now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
-                    self.last_received.set(f"Last update: {datetime.now().strftime('%H:%M:%S')}")
-                    self.last_update_time = time.time()
-                    self.latest_raw_message = f"[{now_str}] {data}"
-
-                    if "Command=LayoutDraw;Clear=2;" in data:
-                        try:
-                            requests.post(f"{API_BASE_URL}/initialise/{self.club_id}")
-                            print("Initialise command sent to server.")
-                        except Exception as e:
-                            with open(LOG_FILE, "a") as log:
-                                log.write(f"[INIT POST ERROR] {datetime.now().isoformat()}\n")
-                                traceback.print_exc(file=log)
-
-                        self.correct_weight = False
-                        self.update_cw_display()
-                        self.msg2_entry.delete(0, tk.END)
-                    else:
-                        self.save_json()
+                for frame in listener.poll():
+                    self.handle_frame(frame)
             except Exception as e:
                 self.status_label.config(text=f"Error: {e}", foreground="red")
                 with open(LOG_FILE, "a") as log:
                     log.write(f"[TCP ERROR] {datetime.now().isoformat()}\n")
                     traceback.print_exc(file=log)
 
+    def handle_frame(self, frame):
+        data = frame.strip()
+        if not data:
+            return
+
+        now_str = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
+        self.last_update_time = time.time()
+        self.latest_raw_message = f"[{now_str}] {data}"
+        self.latest_frame = data
+
+        if "Command=LayoutDraw;Clear=2;" in data:
+            self.last_submit_digest = None
+            self.sender.enqueue(f"/initialise/{self.club_id}", error_tag="INIT POST ERROR")
+            print("Initialise command queued for server.")
+
+            self.correct_weight = False
+            self.update_cw_display()
+            self.msg2_entry.delete(0, tk.END)
+        else:
+            self.save_json()
+
+        last_update = f"Last update: {datetime.now().strftime('%H:%M:%S')}"
+        if self.suppressed_submits:
+            # Identical re-sends from the timing system that were never posted
+            last_update += f" ({self.suppressed_submits} unchanged, not sent)"
+        self.last_received.set(last_update)
+
     def check_connection(self):
         if time.time() - self.last_update_time > TIMEOUT_SECONDS:
             self.status_label.config(text="No Data", foreground="orange")
@@ -253,6 +688,7 @@ class LSDConnect:
 
     def stop(self):
         self.running = False
+        self.sender.stop()
         self.root.destroy()
 
 if __name__ == "__main__":
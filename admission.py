@@ -0,0 +1,98 @@
+# admission.py
+import asyncio
+import logging
+import os
+import time
+
+# Broadcasts per second each club may trigger, and how many may go out back to back
+SUBMIT_RATE = float(os.getenv("SUBMIT_RATE", "5"))
+SUBMIT_BURST = float(os.getenv("SUBMIT_BURST", "10"))
+# Updates merged into one waiting broadcast before further submits get a 429
+SUBMIT_MAX_MERGED = int(os.getenv("SUBMIT_MAX_MERGED", "50"))
+
+logger = logging.getLogger("lsd.admission")
+
+stats = {
+    "admitted": 0,
+    "merged": 0,
+    "rejected": 0,
+    "deferred": 0,
+}
+
+# {club_id: Mailbox}
+_mailboxes = {}
+
+
+class Mailbox:
+    """A club's token bucket plus at most one waiting broadcast.
+
+    Updates that arrive while the bucket is empty fold into the waiting
+    broadcast, which sends whatever the club's state is when a token frees
+    up, so only the latest state goes out.
+    """
+
+    def __init__(self):
+        self.tokens = SUBMIT_BURST
+        self.refilled = time.monotonic()
+        self.waiting = None
+        self.merged = 0
+
+    def _refill(self):
+        now = time.monotonic()
+        self.tokens = min(SUBMIT_BURST, self.tokens + (now - self.refilled) * SUBMIT_RATE)
+        self.refilled = now
+
+    def take(self) -> bool:
+        self._refill()
+        if self.tokens >= 1:
+            self.tokens -= 1
+            return True
+        return False
+
+    def wait_time(self) -> float:
+        self._refill()
+        return max(0.0, (1 - self.tokens) / SUBMIT_RATE)
+
+    async def _send_later(self, deliver):
+        try:
+            while not self.take():
+                await asyncio.sleep(self.wait_time())
+        finally:
+            # Updates from here on need a broadcast of their own
+            self.waiting = None
+            self.merged = 0
+        try:
+            await deliver()
+        except Exception:
+            logger.exception("Deferred broadcast failed")
+
+
+def retry_after(club_id: int):
+    """Seconds to wait before submitting again, or None if the club may submit now."""
+    mailbox = _mailboxes.get(club_id)
+    if mailbox is None or mailbox.waiting is None or mailbox.merged < SUBMIT_MAX_MERGED:
+        return None
+    stats["rejected"] += 1
+    return mailbox.wait_time()
+
+
+async def admit(club_id: int, deliver) -> bool:
+    """Run deliver now if the club has a token, otherwise leave it to the waiting broadcast.
+
+    deliver must read the club's state when it runs, not when it was queued.
+    Returns True if it ran now.
+    """
+    mailbox = _mailboxes.get(club_id)
+    if mailbox is None:
+        mailbox = _mailboxes[club_id] = Mailbox()
+    if mailbox.waiting is None and mailbox.take():
+        stats["admitted"] += 1
+        await deliver()
+        return True
+
+    stats["merged"] += 1
+    mailbox.merged += 1
+    if mailbox.waiting is None:
+        stats["deferred"] += 1
+        mailbox.waiting = asyncio.get_running_loop().create_task(mailbox._send_later(deliver))
+    return False
@@ -0,0 +1,97 @@
+# assets.py
+import gzip
+import hashlib
+import mimetypes
+import os
+
+from fastapi.responses import Response
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+STATIC_DIR = "static"
+# Hashed URLs change whenever the content does, so browsers may keep them forever
+IMMUTABLE = "public, max-age=31536000, immutable"
+# A compressed variant is only kept if it is at most this fraction of the original
+MIN_SAVING_RATIO = 0.9
+# Already compressed formats; recompressing them costs CPU for a byte or two
+PRECOMPRESSED_TYPES = {"image/png", "image/jpeg", "image/gif", "image/webp", "font/woff", "font/woff2"}
+# The display shell keeps its URL, so browsers revalidate it (a 304 when unchanged)
+REVALIDATE = "no-cache"
+
+# {name: Asset} for everything in static/, keyed by file name
+_static = {}
+_shell = None
+
+
+class Asset:
+    """A response body held in memory with its precompressed variants and ETag."""
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str):
+        self.body = body
+        self.media_type = media_type
+        self.cache_control = cache_control
+        self.digest = hashlib.sha256(body).hexdigest()[:12]
+        self.etag = f'"{self.digest}"'
+        # Only kept where compression saves a worthwhile share of the bytes
+        self.encoded = {}
+        if media_type in PRECOMPRESSED_TYPES:
+            return
+        limit = len(body) * MIN_SAVING_RATIO
+        compressed = gzip.compress(body, compresslevel=9, mtime=0)
+        if len(compressed) <= limit:
+            self.encoded["gzip"] = compressed
+        if brotli is not None:
+            compressed = brotli.compress(body, quality=11)
+            if len(compressed) <= limit:
+                self.encoded["br"] = compressed
+
+    def respond(self, request) -> Response:
+        headers = {"ETag": self.etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if request.headers.get("if-none-match") == self.etag:
+            return Response(status_code=304, headers=headers)
+        accepted = request.headers.get("accept-encoding", "")
+        for encoding in ("br", "gzip"):
+            if encoding in self.encoded and encoding in accepted:
+                headers["Content-Encoding"] = encoding
+                return Response(self.encoded[encoding], media_type=self.media_type, headers=headers)
+        return Response(self.body, media_type=self.media_type, headers=headers)
+
+
+def load_static():
+    """Read and precompress every file in static/ (called at startup)."""
+    _static.clear()
+    for name in sorted(os.listdir(STATIC_DIR)):
+        path = os.path.join(STATIC_DIR, name)
+        if not os.path.isfile(path):
+            continue
+        with open(path, "rb") as f:
+            body = f.read()
+        media_type = mimetypes.guess_type(name)[0] or "application/octet-stream"
+        _static[name] = Asset(body, media_type, IMMUTABLE)
+
+
+def asset_url(name: str) -> str:
+    """Content-hashed URL for a file in static/, for use in templates."""
+    if not _static:
+        load_static()
+    return f"/assets/{_static[name].digest}/{name}"
+
+
+def static_asset(name: str, digest: str):
+    """The asset for a hashed URL, or None if the name or hash is unknown (e.g. stale)."""
+    asset = _static.get(name)
+    if asset is None or asset.digest != digest:
+        return None
+    return asset
+
+
+def display_shell(templates) -> Asset:
+    """The scoreboard display page, rendered once; it gets its state over the socket."""
+    global _shell
+    if _shell is None:
+        html = templates.get_template("scoreboard_display.html").render(asset_url=asset_url)
+        _shell = Asset(html.encode(), "text/html; charset=utf-8", REVALIDATE)
+    return _shell
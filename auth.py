@@ -0,0 +1,96 @@
+# auth.py
+import asyncio
+import hashlib
+import hmac
+import os
+import secrets
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+from passlib.hash import bcrypt
+
+import metrics
+
+# bcrypt is CPU bound, so cap how many verifications run at once
+BCRYPT_WORKERS = int(os.getenv("BCRYPT_WORKERS", "4"))
+# How long a verified username/password pair skips bcrypt, and how many are kept
+AUTH_CACHE_TTL = float(os.getenv("AUTH_CACHE_TTL", "300"))
+AUTH_CACHE_SIZE = int(os.getenv("AUTH_CACHE_SIZE", "1024"))
+
+_pool = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+
+# Keys are HMACs under a per-process salt, so plaintext passwords are never held
+_cache_salt = secrets.token_bytes(16)
+_verified = OrderedDict()
+_verified_lock = threading.Lock()
+
+bcrypt_seconds = metrics.Histogram("lsd_bcrypt_seconds", "Time spent in bcrypt verification on the pool")
+cache_lookups = metrics.Counter("lsd_auth_cache_total", "Password checks answered from the cache or by bcrypt", ("result",))
+
+
+def _cache_key(password: str, password_hash: str) -> bytes:
+    message = f"{password_hash}\0{password}".encode()
+    return hmac.new(_cache_salt, message, hashlib.sha256).digest()
+
+
+def _is_cached(key: bytes) -> bool:
+    now = time.monotonic()
+    with _verified_lock:
+        expires = _verified.get(key)
+        if expires is None:
+            return False
+        if expires < now:
+            del _verified[key]
+            return False
+        return True
+
+
+def _timed_verify(password: str, password_hash: str) -> bool:
+    started = time.perf_counter()
+    try:
+        return bcrypt.verify(password, password_hash)
+    finally:
+        bcrypt_seconds.observe(time.perf_counter() - started)
+
+
+def _remember(key: bytes):
+    with _verified_lock:
+        _verified[key] = time.monotonic() + AUTH_CACHE_TTL
+        _verified.move_to_end(key)
+        while len(_verified) > AUTH_CACHE_SIZE:
+            _verified.popitem(last=False)
+
+
+def verify_password(password: str, password_hash: str) -> bool:
+    """Check a password on the bcrypt pool, skipping bcrypt if recently verified.
+
+    For sync handlers, which already run in Starlette's threadpool.
+    """
+    if not password or not password_hash:
+        return False
+    key = _cache_key(password, password_hash)
+    if _is_cached(key):
+        cache_lookups.inc("hit")
+        return True
+    cache_lookups.inc("miss")
+    ok = _pool.submit(_timed_verify, password, password_hash).result()
+    if ok:
+        _remember(key)
+    return ok
+
+
+async def verify_password_async(password: str, password_hash: str) -> bool:
+    """Coroutine form of verify_password that never blocks the event loop."""
+    if not password or not password_hash:
+        return False
+    key = _cache_key(password, password_hash)
+    if _is_cached(key):
+        cache_lookups.inc("hit")
+        return True
+    cache_lookups.inc("miss")
+    ok = await asyncio.wrap_future(_pool.submit(_timed_verify, password, password_hash))
+    if ok:
+        _remember(key)
+    return ok
@@ -0,0 +1,177 @@
+# broker.py
+import asyncio
+import json
+import logging
+import os
+import secrets
+import time
+
+from sqlalchemy import text
+
+from database import async_engine
+
+try:
+    import redis.asyncio as aioredis
+except ImportError:
+    aioredis = None
+
+# local: one process only; sqlite: workers sharing the database; redis: any hosts
+REDIS_URL = os.getenv("REDIS_URL")
+BROADCAST_BACKEND = os.getenv("BROADCAST_BACKEND", "redis" if REDIS_URL else "local")
+REDIS_CHANNEL = os.getenv("REDIS_CHANNEL", "lsd:broadcast")
+# Seconds between checks for other workers' messages with the sqlite backend
+POLL_INTERVAL = float(os.getenv("BROADCAST_POLL_INTERVAL", "0.05"))
+# Seconds sqlite broadcast rows are kept before being pruned
+LOG_RETENTION = 60
+
+logger = logging.getLogger("lsd.broker")
+
+# Tags this worker's messages so it can skip them when they come back
+WORKER_ID = secrets.token_hex(4)
+
+_handler = None
+_backend = None
+
+
+class LocalBackend:
+    """In-process only: nothing to send to other workers."""
+
+    async def start(self):
+        pass
+
+    async def stop(self):
+        pass
+
+    async def send(self, message: dict):
+        pass
+
+
+class SQLiteBackend(LocalBackend):
+    """Workers on one host exchange messages through a table in the shared database."""
+
+    def __init__(self):
+        self.last_id = 0
+        self.task = None
+
+    async def start(self):
+        async with async_engine.begin() as conn:
+            await conn.execute(text(
+                "CREATE TABLE IF NOT EXISTS broadcast_log ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, origin TEXT, body TEXT, created REAL)"
+            ))
+            self.last_id = (await conn.execute(text("SELECT COALESCE(MAX(id), 0) FROM broadcast_log"))).scalar()
+        self.task = asyncio.get_running_loop().create_task(self._poll())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+
+    async def send(self, message: dict):
+        async with async_engine.begin() as conn:
+            await conn.execute(
+                text("INSERT INTO broadcast_log (origin, body, created) VALUES (:origin, :body, :created)"),
+                {"origin": WORKER_ID, "body": json.dumps(message), "created": time.time()},
+            )
+
+    async def _poll(self):
+        last_prune = time.time()
+        while True:
+            await asyncio.sleep(POLL_INTERVAL)
+            try:
+                async with async_engine.connect() as conn:
+                    rows = (await conn.execute(
+                        text("SELECT id, origin, body FROM broadcast_log WHERE id > :last ORDER BY id"),
+                        {"last": self.last_id},
+                    )).all()
+                for row_id, origin, body in rows:
+                    self.last_id = row_id
+                    if origin != WORKER_ID:
+                        await _handler(json.loads(body))
+                if time.time() - last_prune > LOG_RETENTION:
+                    last_prune = time.time()
+                    async with async_engine.begin() as conn:
+                        await conn.execute(
+                            text("DELETE FROM broadcast_log WHERE created < :cutoff"),
+                            {"cutoff": last_prune - LOG_RETENTION},
+                        )
+            except Exception:
+                logger.exception("Broadcast poll failed")
+
+
+class RedisBackend(LocalBackend):
+    """Workers on any host exchange messages over a Redis pub/sub channel."""
+
+    def __init__(self):
+        if aioredis is None:
+            raise RuntimeError("BROADCAST_BACKEND=redis needs the redis package installed")
+        self.redis = aioredis.from_url(REDIS_URL or "redis://localhost:6379/0")
+        self.task = None
+
+    async def start(self):
+        pubsub = self.redis.pubsub()
+        await pubsub.subscribe(REDIS_CHANNEL)
+        self.task = asyncio.get_running_loop().create_task(self._listen(pubsub))
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            try:
+                await self.task
+            except asyncio.CancelledError:
+                pass
+        await self.redis.close()
+
+    async def send(self, message: dict):
+        await self.redis.publish(REDIS_CHANNEL, json.dumps({"origin": WORKER_ID, "message": message}))
+
+    async def _listen(self, pubsub):
+        while True:
+            try:
+                async for item in pubsub.listen():
+                    if item.get("type") != "message":
+                        continue
+                    envelope = json.loads(item["data"])
+                    if envelope.get("origin") != WORKER_ID:
+                        await _handler(envelope["message"])
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Broadcast listener failed")
+                await asyncio.sleep(1)
+
+
+BACKENDS = {
+    "local": LocalBackend,
+    "sqlite": SQLiteBackend,
+    "redis": RedisBackend,
+}
+
+
+def set_handler(handler):
+    """Register the coroutine that delivers a message to this worker's sockets."""
+    global _handler
+    _handler = handler
+
+
+async def start():
+    global _backend
+    _backend = BACKENDS[BROADCAST_BACKEND]()
+    await _backend.start()
+
+
+async def stop():
+    global _backend
+    if _backend is not None:
+        await _backend.stop()
+        _backend = None
+
+
+async def publish(message: dict):
+    """Deliver a message to this worker's sockets, then pass it to the other workers."""
+    await _handler(message)
+    if _backend is not None:
+        await _backend.send(message)
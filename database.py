@@ -1,6 +1,85 @@
 # database.py
-from sqlmodel import create_engine
+import logging
+import os
+import time
+
+from sqlalchemy import event
+from sqlalchemy.ext.asyncio import create_async_engine
+from sqlalchemy.pool import QueuePool
+from sqlmodel import SQLModel, create_engine
+
+import metrics
 
 # Update this path if you're not using Render's /data volume
-DATABASE_URL = "sqlite:////data/database.db"
-engine = create_engine(DATABASE_URL, echo=True)
+DATABASE_URL = os.getenv("DATABASE_URL", "sqlite:////data/database.db")
+
+# Set SQL_ECHO=1 to log every statement through the normal log queue; too noisy for production
+SQL_ECHO = os.getenv("SQL_ECHO", "0") == "1"
+if SQL_ECHO:
+    logging.getLogger("sqlalchemy.engine").setLevel(logging.INFO)
+
+# One pooled connection per concurrent handler thread, reused across requests
+DB_POOL_SIZE = int(os.getenv("DB_POOL_SIZE", "10"))
+DB_MAX_OVERFLOW = int(os.getenv("DB_MAX_OVERFLOW", "30"))
+
+engine = create_engine(
+    DATABASE_URL,
+    poolclass=QueuePool,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    connect_args={"check_same_thread": False, "timeout": 30},
+)
+
+
+# Same database through aiosqlite, for coroutine handlers that must not block the loop
+ASYNC_DATABASE_URL = DATABASE_URL.replace("sqlite://", "sqlite+aiosqlite://", 1)
+async_engine = create_async_engine(
+    ASYNC_DATABASE_URL,
+    pool_size=DB_POOL_SIZE,
+    max_overflow=DB_MAX_OVERFLOW,
+    connect_args={"timeout": 30},
+)
+
+
+@event.listens_for(engine, "connect")
+@event.listens_for(async_engine.sync_engine, "connect")
+def _set_sqlite_pragmas(dbapi_connection, connection_record):
+    # WAL lets readers run alongside the single writer; NORMAL is safe under WAL
+    cursor = dbapi_connection.cursor()
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.close()
+
+
+query_seconds = metrics.Histogram("lsd_db_query_seconds", "Time spent executing each SQL statement")
+
+
+@event.listens_for(engine, "before_cursor_execute")
+@event.listens_for(async_engine.sync_engine, "before_cursor_execute")
+def _start_query_timer(conn, cursor, statement, parameters, context, executemany):
+    # Kept on the statement's own context, so one that fails leaves nothing behind
+    if context is not None:
+        context._query_start = time.perf_counter()
+
+
+@event.listens_for(engine, "after_cursor_execute")
+@event.listens_for(async_engine.sync_engine, "after_cursor_execute")
+def _stop_query_timer(conn, cursor, statement, parameters, context, executemany):
+    start = getattr(context, "_query_start", None)
+    if start is not None:
+        query_seconds.observe(time.perf_counter() - start)
+
+
+def migrate():
+    """Create missing tables, columns and indexes. Safe to run on every start."""
+    SQLModel.metadata.create_all(engine)
+    with engine.begin() as conn:
+        info = conn.exec_driver_sql("PRAGMA table_info(daypass)").fetchall()
+        cols = [row[1] for row in info]
+        if "club_name" not in cols:
+            conn.exec_driver_sql("ALTER TABLE daypass ADD COLUMN club_name TEXT")
+
+        # create_all only adds indexes when it creates the table itself
+        for table in SQLModel.metadata.sorted_tables:
+            for index in table.indexes:
+                index.create(conn, checkfirst=True)
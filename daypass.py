@@ -0,0 +1,182 @@
+# daypass.py
+import csv
+import io
+import os
+import time
+from datetime import datetime, timedelta
+
+from sqlalchemy import DateTime, Integer, cast, exists, func, insert, literal, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import async_engine, engine
+from models import Club, DayPass, DayPassMonthly
+
+DAY_PASS_PERIOD = timedelta(hours=24)
+
+# Seconds a club's dashboard figures are reused before being re-queried
+STATS_CACHE_TTL = float(os.getenv("DAYPASS_STATS_TTL", "30"))
+
+# Most recent day pass per club, so the submit path can skip the database
+last_day_pass = {}
+
+# Dashboard figures per club: {club_id: (expires, stats)}
+_stats_cache = {}
+
+
+def warm_cache():
+    """Load every club's latest day pass in one grouped query (called at startup)."""
+    query = select(DayPass.club_id, func.max(DayPass.timestamp)).group_by(DayPass.club_id)
+    with engine.connect() as conn:
+        for club_id, timestamp in conn.execute(query):
+            last_day_pass[club_id] = timestamp
+
+
+def day_pass_due(club_id: int, now: datetime = None) -> bool:
+    last = last_day_pass.get(club_id)
+    if last is None:
+        return True
+    return (now or datetime.utcnow()) - last > DAY_PASS_PERIOD
+
+
+async def record_day_pass(club_id: int):
+    """Record a day pass if more than 24 hours have passed since the club's last one.
+
+    The check and insert are one INSERT ... SELECT ... WHERE NOT EXISTS statement,
+    so concurrent workers can never both record a pass for the same period.
+    """
+    now = datetime.utcnow()
+    if not day_pass_due(club_id, now):
+        return
+
+    club_name = select(Club.name).where(Club.id == club_id).scalar_subquery()
+    recent = exists().where(DayPass.club_id == club_id, DayPass.timestamp >= now - DAY_PASS_PERIOD)
+    stmt = insert(DayPass).from_select(
+        ["club_id", "club_name", "timestamp"],
+        select(literal(club_id), func.coalesce(club_name, ""), literal(now, DateTime)).where(~recent),
+    )
+    async with async_engine.begin() as conn:
+        if (await conn.execute(stmt)).rowcount:
+            await conn.execute(_monthly_increment(club_id, now))
+            last = now
+            _stats_cache.pop(club_id, None)
+        else:
+            # Another worker got there first; pick up its timestamp
+            last = (await conn.execute(
+                select(func.max(DayPass.timestamp)).where(DayPass.club_id == club_id)
+            )).scalar()
+    last_day_pass[club_id] = last
+
+
+def _monthly_increment(club_id: int, when: datetime):
+    stmt = sqlite_insert(DayPassMonthly).values(club_id=club_id, year=when.year, month=when.month, count=1)
+    return stmt.on_conflict_do_update(
+        index_elements=["club_id", "year", "month"],
+        set_={"count": DayPassMonthly.count + 1},
+    )
+
+
+def backfill_monthly():
+    """Build the monthly rollup from existing day passes if it has never been filled."""
+    with engine.begin() as conn:
+        if conn.execute(select(DayPassMonthly.club_id).limit(1)).first() is not None:
+            return
+        year = cast(func.strftime("%Y", DayPass.timestamp), Integer)
+        month = cast(func.strftime("%m", DayPass.timestamp), Integer)
+        totals = select(DayPass.club_id, year, month, func.count()).group_by(DayPass.club_id, year, month)
+        conn.execute(
+            sqlite_insert(DayPassMonthly)
+            .from_select(["club_id", "year", "month", "count"], totals)
+            .on_conflict_do_nothing()
+        )
+
+
+def month_range(year: int, month: int):
+    """Start and end (exclusive) of a calendar month, for index-friendly range filters."""
+    start = datetime(year, month, 1)
+    end = datetime(year + month // 12, month % 12 + 1, 1)
+    return start, end
+
+
+def daypass_stats(club_id: int) -> dict:
+    """All-time, this-month and 30 most recent day passes for a club.
+
+    Totals come from the monthly rollup and the recent list from the
+    (club_id, timestamp) index, so the cost doesn't grow with history.
+    """
+    cached = _stats_cache.get(club_id)
+    if cached and cached[0] > time.monotonic():
+        return cached[1]
+
+    now = datetime.utcnow()
+    with engine.connect() as conn:
+        all_time = conn.execute(
+            select(func.coalesce(func.sum(DayPassMonthly.count), 0)).where(DayPassMonthly.club_id == club_id)
+        ).scalar()
+        this_month = conn.execute(
+            select(DayPassMonthly.count).where(
+                DayPassMonthly.club_id == club_id,
+                DayPassMonthly.year == now.year,
+                DayPassMonthly.month == now.month,
+            )
+        ).scalar()
+        recent = conn.execute(
+            select(DayPass.club_name, DayPass.timestamp)
+            .where(DayPass.club_id == club_id)
+            .order_by(DayPass.timestamp.desc())
+            .limit(30)
+        ).all()
+
+    stats = {
+        "all_time": all_time,
+        "this_month": this_month or 0,
+        "recent_logs": [
+            {"club": club_name, "timestamp": timestamp.strftime("%Y-%m-%d %H:%M:%S")}
+            for club_name, timestamp in recent
+        ],
+    }
+    _stats_cache[club_id] = (time.monotonic() + STATS_CACHE_TTL, stats)
+    return stats
+
+
+def iter_daypasses(club_id: int = None, start: datetime = None, end: datetime = None, batch_size: int = 500):
+    """Yield batches of (club_id, club_name, timestamp) rows straight from a streaming cursor.
+
+    None for club_id means every club; rows come in (club_id, timestamp) index order.
+    """
+    query = select(DayPass.club_id, DayPass.club_name, DayPass.timestamp)
+    if club_id is not None:
+        query = query.where(DayPass.club_id == club_id)
+    if start is not None:
+        query = query.where(DayPass.timestamp >= start)
+    if end is not None:
+        query = query.where(DayPass.timestamp < end)
+    query = query.order_by(DayPass.club_id, DayPass.timestamp)
+
+    with engine.connect() as conn:
+        result = conn.execution_options(stream_results=True, yield_per=batch_size).execute(query)
+        for batch in result.partitions():
+            yield batch
+
+
+def export_chunks(fmt: str, club_id: int = None, start: datetime = None, end: datetime = None):
+    """Render day passes as text or CSV, one chunk per database batch."""
+    if fmt == "csv":
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        writer.writerow(["club_id", "club", "timestamp"])
+        yield buffer.getvalue()
+        for batch in iter_daypasses(club_id, start, end):
+            buffer.seek(0)
+            buffer.truncate()
+            writer.writerows(
+                (row_club_id, club_name, timestamp.strftime("%Y-%m-%d %H:%M:%S"))
+                for row_club_id, club_name, timestamp in batch
+            )
+            yield buffer.getvalue()
+        return
+
+    separator = ""
+    for batch in iter_daypasses(club_id, start, end):
+        lines = [f"{timestamp.strftime('%Y-%m-%d %H:%M:%S')} - {club_name}" for _, club_name, timestamp in batch]
+        yield separator + "\n".join(lines)
+        separator = "\n"
@@ -0,0 +1,191 @@
+# history.py
+import asyncio
+import json
+import logging
+import os
+from datetime import date, datetime
+
+from sqlalchemy import Integer, cast, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import DataError, IntegrityError
+
+from database import async_engine
+from models import RaceResult
+
+# Seconds between background writes of race results
+FLUSH_INTERVAL = float(os.getenv("HISTORY_FLUSH_INTERVAL", "2.0"))
+# Races returned per page when the caller doesn't ask for a size, and the most allowed
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+logger = logging.getLogger("lsd.history")
+
+# Latest unwritten result per race: {(club_id, race_date, venue_name, race_no): row}
+_pending = {}
+_flush_task = None
+_flush_lock = asyncio.Lock()
+
+stats = {
+    "recorded": 0,
+    "written": 0,
+    "errors": 0,
+    "dropped": 0,
+}
+
+
+def _race_date(timestamp) -> date:
+    # The client stamps submits with its local time, which is the meeting's date
+    try:
+        return datetime.fromisoformat(timestamp).date()
+    except (TypeError, ValueError):
+        return date.today()
+
+
+def record(club_id: int, data: dict, timestamp: str = None):
+    """Queue the latest result for the race in data; written out by the flush loop."""
+    race_no = data.get("race_no")
+    runners = data.get("runners")
+    venue_name = data.get("venue_name", "")
+    message1 = data.get("message1", "")
+    if not race_no or not runners:
+        return
+    if not all(isinstance(value, str) for value in (race_no, venue_name, message1)) or not isinstance(runners, list):
+        # Would fail the table's constraints or the pending key; never let it reach a flush
+        stats["dropped"] += 1
+        return
+    row = {
+        "club_id": club_id,
+        "venue_name": venue_name,
+        "race_date": _race_date(timestamp),
+        "race_no": race_no,
+        "runners": json.dumps(runners, ensure_ascii=False, separators=(",", ":"), default=str),
+        "message1": message1,
+        "updated": datetime.utcnow(),
+    }
+    stats["recorded"] += 1
+    _pending[(club_id, row["race_date"], row["venue_name"], race_no)] = row
+
+
+def _upsert():
+    stmt = sqlite_insert(RaceResult)
+    return stmt.on_conflict_do_update(
+        index_elements=["club_id", "race_date", "venue_name", "race_no"],
+        set_={
+            "runners": stmt.excluded.runners,
+            "message1": stmt.excluded.message1,
+            "updated": stmt.excluded.updated,
+        },
+    )
+
+
+async def flush():
+    """Write every pending race result now, one upsert per race."""
+    global _pending
+    async with _flush_lock:
+        if not _pending:
+            return
+        batch, _pending = _pending, {}
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(_upsert(), list(batch.values()))
+            stats["written"] += len(batch)
+        except Exception:
+            stats["errors"] += 1
+            logger.exception("Failed to write %d race results; retrying one at a time", len(batch))
+            await _write_each(batch)
+
+
+async def _write_each(batch: dict):
+    """Write rows separately so one bad row can't hold back the rest.
+
+    Rows the database rejects outright are dropped; anything else (e.g. a
+    locked database) is retried on the next flush.
+    """
+    for key, row in batch.items():
+        try:
+            async with async_engine.begin() as conn:
+                await conn.execute(_upsert(), [row])
+            stats["written"] += 1
+        except (IntegrityError, DataError):
+            stats["dropped"] += 1
+            logger.exception("Dropped race result %s", key)
+        except Exception:
+            # Retry on the next flush unless a newer result has arrived
+            _pending.setdefault(key, row)
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        await asyncio.shield(flush())
+
+
+def start():
+    global _flush_task
+    _flush_task = asyncio.get_running_loop().create_task(_flush_loop())
+
+
+async def stop():
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    await flush()
+
+
+def _as_dict(row) -> dict:
+    return {
+        "id": row.id,
+        "venue_name": row.venue_name,
+        "race_date": row.race_date.isoformat(),
+        "race_no": row.race_no,
+        "runners": json.loads(row.runners),
+        "message1": row.message1,
+        "updated": row.updated.strftime("%Y-%m-%d %H:%M:%S"),
+    }
+
+
+_COLUMNS = (
+    RaceResult.id,
+    RaceResult.venue_name,
+    RaceResult.race_date,
+    RaceResult.race_no,
+    RaceResult.runners,
+    RaceResult.message1,
+    RaceResult.updated,
+)
+
+
+async def recent_races(club_id: int, limit: int = PAGE_SIZE, before: int = None) -> dict:
+    """A club's races, newest first, a page at a time.
+
+    Pages are keyed on id rather than offset, so each one is a single
+    index range scan however deep into the season it is. Pass the
+    returned next_before to get the following page.
+    """
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    query = select(*_COLUMNS).where(RaceResult.club_id == club_id)
+    if before is not None:
+        query = query.where(RaceResult.id < before)
+    query = query.order_by(RaceResult.id.desc()).limit(limit)
+    async with async_engine.connect() as conn:
+        rows = (await conn.execute(query)).all()
+    return {
+        "races": [_as_dict(row) for row in rows],
+        "next_before": rows[-1].id if len(rows) == limit else None,
+    }
+
+
+async def meeting_results(club_id: int, race_date: date, venue_name: str = None) -> list:
+    """Every race for a club on one day, optionally at one venue, in race order."""
+    query = select(*_COLUMNS).where(RaceResult.club_id == club_id, RaceResult.race_date == race_date)
+    if venue_name is not None:
+        query = query.where(RaceResult.venue_name == venue_name)
+    query = query.order_by(RaceResult.venue_name, cast(RaceResult.race_no, Integer), RaceResult.id)
+    async with async_engine.connect() as conn:
+        rows = (await conn.execute(query)).all()
+    return [_as_dict(row) for row in rows]
@@ -0,0 +1,210 @@
+# hub.py
+import asyncio
+import json
+import os
+import time
+
+import metrics
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# Messages a slow socket may fall behind by before its oldest is dropped
+SEND_QUEUE_SIZE = int(os.getenv("WS_SEND_QUEUE_SIZE", "16"))
+# Seconds a single send may take before the socket is treated as dead
+SEND_TIMEOUT = float(os.getenv("WS_SEND_TIMEOUT", "5"))
+
+# Channels a subscriber can join: /scoreboard/ws displays and /ws listeners
+SCOREBOARD = "scoreboard"
+LISTENER = "ws"
+
+# Connected subscribers per club: {club_id: set of Subscriber}
+subscribers = {}
+
+stats = {
+    "published": 0,
+    "sent": 0,
+    "dropped": 0,
+    "evicted": 0,
+}
+
+# Publish-to-send latency per club, in seconds
+fanout_stats = {}
+
+fanout_seconds = metrics.Histogram("lsd_ws_fanout_seconds", "Time from publish until a frame is written to a socket")
+
+
+class Subscriber:
+    """One WebSocket with its own bounded send queue and sender task."""
+
+    def __init__(self, club_id: int, websocket, channel: str):
+        self.club_id = club_id
+        self.websocket = websocket
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        # True while a snapshot is waiting at the head of the queue
+        self.snapshot_queued = False
+        self.task = asyncio.get_running_loop().create_task(self._sender())
+
+    def offer(self, frame: str, published_at: float):
+        if self.queue.full():
+            stats["dropped"] += 1
+            if self.snapshot_queued:
+                # Never drop the snapshot; the display resyncs on the gap once it has it
+                return
+            # Latest state wins: drop the oldest unsent message
+            self.queue.get_nowait()
+        self.queue.put_nowait((frame, published_at, False))
+
+    def send(self, data):
+        """Queue a message for this subscriber alone."""
+        self.offer(encode_json(data), time.perf_counter())
+
+    def send_snapshot(self, data):
+        """Queue a full snapshot in place of everything still unsent, which it supersedes."""
+        while not self.queue.empty():
+            self.queue.get_nowait()
+            stats["dropped"] += 1
+        self.queue.put_nowait((encode_json(data), time.perf_counter(), True))
+        self.snapshot_queued = True
+
+    def _take(self, item):
+        frame, published_at, is_snapshot = item
+        if is_snapshot:
+            self.snapshot_queued = False
+        return frame, published_at
+
+    async def _sender(self):
+        try:
+            while True:
+                frame, published_at = self._take(await self.queue.get())
+                await asyncio.wait_for(self.websocket.send_text(frame), SEND_TIMEOUT)
+                stats["sent"] += 1
+                _record_fanout(self.club_id, time.perf_counter() - published_at)
+        except asyncio.CancelledError:
+            raise
+        except Exception:
+            stats["evicted"] += 1
+            unsubscribe(self)
+            try:
+                await asyncio.wait_for(self.websocket.close(), SEND_TIMEOUT)
+            except Exception:
+                pass
+
+
+class StreamSubscriber(Subscriber):
+    """A subscriber without a socket; the handler that owns it pulls frames with receive().
+
+    For Server-Sent Events and long-polling, where the response body or the
+    reply itself is the send.
+    """
+
+    def __init__(self, club_id: int, channel: str):
+        self.club_id = club_id
+        self.websocket = None
+        self.channel = channel
+        self.queue = asyncio.Queue(maxsize=SEND_QUEUE_SIZE)
+        self.snapshot_queued = False
+        self.task = None
+
+    async def receive(self, timeout: float):
+        """The next queued frame, or None if none arrives within timeout seconds."""
+        try:
+            frame, published_at = self._take(await asyncio.wait_for(self.queue.get(), timeout))
+        except asyncio.TimeoutError:
+            return None
+        stats["sent"] += 1
+        _record_fanout(self.club_id, time.perf_counter() - published_at)
+        return frame
+
+
+def encode_json(data) -> str:
+    """Encode a payload once, using orjson when it is installed."""
+    if orjson is not None:
+        return orjson.dumps(data).decode()
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":"))
+
+
+def _record_fanout(club_id: int, seconds: float):
+    fanout_seconds.observe(seconds)
+    entry = fanout_stats.setdefault(club_id, {"count": 0, "total": 0.0, "max": 0.0, "last": 0.0})
+    entry["count"] += 1
+    entry["total"] += seconds
+    entry["last"] = seconds
+    if seconds > entry["max"]:
+        entry["max"] = seconds
+
+
+def subscribe(club_id: int, websocket, channel: str) -> Subscriber:
+    subscriber = Subscriber(club_id, websocket, channel)
+    subscribers.setdefault(club_id, set()).add(subscriber)
+    return subscriber
+
+
+def subscribe_stream(club_id: int, channel: str) -> StreamSubscriber:
+    subscriber = StreamSubscriber(club_id, channel)
+    subscribers.setdefault(club_id, set()).add(subscriber)
+    return subscriber
+
+
+def unsubscribe(subscriber: Subscriber):
+    club_subscribers = subscribers.get(subscriber.club_id)
+    if club_subscribers is not None:
+        club_subscribers.discard(subscriber)
+        if not club_subscribers:
+            del subscribers[subscriber.club_id]
+    if subscriber.task is not None and subscriber.task is not asyncio.current_task():
+        subscriber.task.cancel()
+
+
+def publish(club_id: int, data, channels=None):
+    """Queue data for every subscriber of a club without waiting on any socket.
+
+    channels limits delivery to the named channels; None sends to all.
+    The payload is encoded once and the same text frame goes to every socket.
+    """
+    stats["published"] += 1
+    published_at = time.perf_counter()
+    frame = None
+    for subscriber in list(subscribers.get(club_id, ())):
+        if channels is None or subscriber.channel in channels:
+            if frame is None:
+                frame = encode_json(data)
+            subscriber.offer(frame, published_at)
+
+
+def club_stats() -> dict:
+    result = {}
+    for club_id, club_subscribers in subscribers.items():
+        channels = {}
+        for subscriber in club_subscribers:
+            channels[subscriber.channel] = channels.get(subscriber.channel, 0) + 1
+        result[club_id] = {"subscribers": channels}
+    for club_id, entry in fanout_stats.items():
+        average = entry["total"] / entry["count"] if entry["count"] else 0.0
+        result.setdefault(club_id, {"subscribers": {}})["fanout_ms"] = {
+            "count": entry["count"],
+            "avg": round(average * 1000, 3),
+            "max": round(entry["max"] * 1000, 3),
+            "last": round(entry["last"] * 1000, 3),
+        }
+    return result
+
+
+@metrics.register_collector
+def _socket_metrics():
+    samples = []
+    for club_id, club_subscribers in subscribers.items():
+        channels = {}
+        for subscriber in club_subscribers:
+            channels[subscriber.channel] = channels.get(subscriber.channel, 0) + 1
+        samples.extend(((str(club_id), channel), count) for channel, count in channels.items())
+    return "lsd_ws_connected", "gauge", "Connected sockets per club and channel", ("club_id", "channel"), samples
+
+
+@metrics.register_collector
+def _send_metrics():
+    samples = [((outcome,), stats[outcome]) for outcome in ("sent", "dropped", "evicted")]
+    return "lsd_ws_frames_total", "counter", "Frames sent, dropped for slow sockets, and sockets evicted", ("outcome",), samples
@@ -0,0 +1,170 @@
+# logs.py
+import copy
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import tempfile
+from collections import deque
+
+import metrics
+
+# Level for the app's own loggers: DEBUG, INFO, WARNING, ...
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO").upper()
+# json: one object per line, for Render's log search; text: plain lines for a terminal
+LOG_FORMAT = os.getenv("LOG_FORMAT", "json")
+# Records waiting for the writer thread before new ones are dropped
+LOG_QUEUE_SIZE = int(os.getenv("LOG_QUEUE_SIZE", "10000"))
+# Log one of every N packets per club at INFO; every packet is logged at DEBUG
+LOG_PACKET_SAMPLE = max(1, int(os.getenv("LOG_PACKET_SAMPLE", "50")))
+# Directory for the last RAW_LOG_SIZE raw messages per club; unset to disable
+RAW_LOG_DIR = os.getenv("RAW_LOG_DIR")
+RAW_LOG_SIZE = int(os.getenv("RAW_LOG_SIZE", "500"))
+
+packet_logger = logging.getLogger("lsd.packets")
+raw_logger = logging.getLogger("lsd.raw")
+
+dropped = metrics.Counter("lsd_log_dropped_total", "Log records dropped because the log queue was full")
+
+# Packets seen per club, for sampling
+_packet_counts = {}
+_listener = None
+
+
+class JSONFormatter(logging.Formatter):
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        fields = getattr(record, "fields", None)
+        if fields:
+            entry.update(fields)
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+
+class DroppingQueueHandler(logging.handlers.QueueHandler):
+    """Never blocks the caller: a full queue drops the record and counts it.
+
+    Records are queued unformatted, exc_info included, so message and
+    traceback formatting happen on the writer thread.
+    """
+
+    def prepare(self, record):
+        record = copy.copy(record)
+        # Fix the message now in case its arguments change before the writer gets to it
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            dropped.inc()
+
+
+class RawRingHandler(logging.Handler):
+    """Keeps the last RAW_LOG_SIZE raw messages per club in raw_club_<id>.jsonl.
+
+    Lines are appended; once a file holds twice the limit it is rewritten
+    with only the newest, so each message costs one append on average.
+    Runs on the log writer thread, never on the request path.
+    """
+
+    def __init__(self, directory: str, size: int):
+        super().__init__()
+        self.directory = directory
+        self.size = size
+        # {club_id: (recent lines, lines currently in the file)}
+        self.clubs = {}
+        os.makedirs(directory, exist_ok=True)
+
+    def emit(self, record):
+        try:
+            club_id = record.fields["club_id"]
+            line = json.dumps({"ts": round(record.created, 3), "raw": record.fields["raw"]}, ensure_ascii=False)
+            recent, written = self.clubs.get(club_id) or (deque(maxlen=self.size), 0)
+            recent.append(line)
+            path = os.path.join(self.directory, f"raw_club_{club_id}.jsonl")
+            if written + 1 >= 2 * self.size:
+                self._rewrite(path, recent)
+                written = len(recent)
+            else:
+                with open(path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+                written += 1
+            self.clubs[club_id] = (recent, written)
+        except Exception:
+            self.handleError(record)
+
+    def _rewrite(self, path: str, lines):
+        fd, tmp_path = tempfile.mkstemp(dir=self.directory, prefix=".tmp_", suffix=".jsonl")
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        os.replace(tmp_path, path)
+
+
+def setup():
+    """Route all logging through one queue drained by a background writer thread."""
+    global _listener
+    if _listener is not None:
+        return
+
+    stream = logging.StreamHandler()
+    if LOG_FORMAT == "json":
+        stream.setFormatter(JSONFormatter())
+    else:
+        stream.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    stream.addFilter(lambda record: record.name != raw_logger.name)
+    handlers = [stream]
+
+    raw_logger.setLevel(logging.CRITICAL)
+    if RAW_LOG_DIR:
+        ring = RawRingHandler(RAW_LOG_DIR, RAW_LOG_SIZE)
+        ring.addFilter(lambda record: record.name == raw_logger.name)
+        handlers.append(ring)
+        raw_logger.setLevel(logging.INFO)
+
+    log_queue = queue.Queue(maxsize=LOG_QUEUE_SIZE)
+    root = logging.getLogger()
+    root.handlers = [DroppingQueueHandler(log_queue)]
+    logging.getLogger("lsd").setLevel(LOG_LEVEL)
+
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+
+
+def stop():
+    """Write out whatever is still queued and stop the writer thread."""
+    global _listener
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
+
+def log_packet(club_id: int, result_data: dict):
+    """Log an incoming packet, sampled per club, and keep it in the raw ring buffer."""
+    raw = result_data.get("raw_message", "")
+    if raw_logger.isEnabledFor(logging.INFO):
+        raw_logger.info("raw", extra={"fields": {"club_id": club_id, "raw": raw}})
+
+    count = _packet_counts.get(club_id, 0) + 1
+    _packet_counts[club_id] = count
+    if packet_logger.isEnabledFor(logging.DEBUG):
+        level = logging.DEBUG
+    elif LOG_PACKET_SAMPLE == 1 or count % LOG_PACKET_SAMPLE == 1:
+        level = logging.INFO
+    else:
+        return
+    packet_logger.log(level, "packet", extra={"fields": {
+        "club_id": club_id,
+        "seen": count,
+        "venue": result_data.get("venue_name"),
+        "raw": raw[:200],
+    }})
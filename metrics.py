@@ -0,0 +1,108 @@
+# metrics.py
+import threading
+from bisect import bisect_left
+
+# Seconds; spans a fast submit (well under a millisecond) up to a slow bcrypt or fsync
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+
+# Everything rendered at /metrics, in registration order
+_metrics = []
+# Callables returning (name, type, help, label names, [(label values, value), ...])
+# for figures another module already keeps
+_collectors = []
+
+
+def _format_labels(names, values) -> str:
+    if not names:
+        return ""
+    pairs = ",".join(f'{name}="{value}"' for name, value in zip(names, values))
+    return "{" + pairs + "}"
+
+
+def _format_value(value) -> str:
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic count, optionally split by label values."""
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def inc(self, *label_values, amount=1):
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        for label_values, value in sorted(self.values.items()):
+            lines.append(f"{self.name}{_format_labels(self.labels, label_values)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Bucketed observations, optionally split by label values.
+
+    observe() bumps a single bucket; the cumulative counts Prometheus expects
+    are only worked out when /metrics is scraped.
+    """
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(buckets)
+        # {label_values: [per-bucket counts (last is +Inf), sum, count]}
+        self.values = {}
+        self.lock = threading.Lock()
+        _metrics.append(self)
+
+    def observe(self, value: float, *label_values):
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            entry = self.values.get(label_values)
+            if entry is None:
+                entry = self.values[label_values] = [[0] * (len(self.buckets) + 1), 0.0, 0]
+            entry[0][index] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self.lock:
+            snapshot = [(key, list(entry[0]), entry[1], entry[2]) for key, entry in self.values.items()]
+        for label_values, counts, total, count in sorted(snapshot):
+            names = self.labels + ("le",)
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets + ("+Inf",), counts):
+                cumulative += bucket_count
+                lines.append(f"{self.name}_bucket{_format_labels(names, label_values + (bound,))} {cumulative}")
+            labels = _format_labels(self.labels, label_values)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+def register_collector(collector):
+    """Add a callable that reports values another module already keeps."""
+    _collectors.append(collector)
+    return collector
+
+
+def render() -> str:
+    """Every metric in the Prometheus text exposition format."""
+    lines = []
+    for metric in _metrics:
+        lines.extend(metric.render())
+    for collector in _collectors:
+        name, kind, help, labels, samples = collector()
+        lines.append(f"# HELP {name} {help}")
+        lines.append(f"# TYPE {name} {kind}")
+        for label_values, value in samples:
+            lines.append(f"{name}{_format_labels(labels, label_values)} {_format_value(value)}")
+    return "\n".join(lines) + "\n"
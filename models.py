@@ -1,26 +1,50 @@
 # models.py
 from typing import Optional, List
 from sqlmodel import SQLModel, Field
+from sqlalchemy import Index
 from pydantic import BaseModel
-from datetime import datetime
+from datetime import date, datetime
 
 class Club(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
-    username: str
+    username: str = Field(index=True)
     password_hash: str
 
 class Venue(SQLModel, table=True):
     id: Optional[int] = Field(default=None, primary_key=True)
     name: str
-    club_id: int
+    club_id: int = Field(index=True)
 
 class DayPass(SQLModel, table=True):
+    __table_args__ = (Index("ix_daypass_club_id_timestamp", "club_id", "timestamp"),)
+
     id: Optional[int] = Field(default=None, primary_key=True)
     club_id: int
     club_name: str
     timestamp: datetime
 
+class DayPassMonthly(SQLModel, table=True):
+    club_id: int = Field(primary_key=True)
+    year: int = Field(primary_key=True)
+    month: int = Field(primary_key=True)
+    count: int = 0
+
+class RaceResult(SQLModel, table=True):
+    __table_args__ = (
+        Index("ix_raceresult_race", "club_id", "race_date", "venue_name", "race_no", unique=True),
+        Index("ix_raceresult_club_id", "club_id"),
+    )
+
+    id: Optional[int] = Field(default=None, primary_key=True)
+    club_id: int
+    venue_name: str
+    race_date: date
+    race_no: str
+    runners: str  # JSON list of "<horse id> - <time>" lines
+    message1: str = ""
+    updated: datetime
+
 class Result(BaseModel):
     timestamp: str
     club_id: int
@@ -0,0 +1,47 @@
+# parsing.py
+import re
+from typing import List, NamedTuple, Optional, Tuple
+
+_TIMESTAMP_PREFIX = re.compile(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\]\s*(.*)")
+_RACE = re.compile(r"Race:\s*(\d+)")
+_RUNNER = re.compile(r"Place:(\d*)\s+HorseID:(\d+)\s+Time:([0-9:.]*)")
+
+
+# (place, horse_id, time) straight from the regex; plain tuples keep this cheap
+Runner = Tuple[str, str, str]
+
+
+class ParsedMessage(NamedTuple):
+    race_no: Optional[str]
+    runners: List[Runner]
+    message1: Optional[str]
+
+    @property
+    def runner_lines(self) -> List[str]:
+        """Runners in the "<horse id> - <time>" form the displays expect."""
+        return [f"{horse_id} - {time or '—'}" for _, horse_id, time in self.runners]
+
+def parse_raw_message(raw: str) -> ParsedMessage:
+    """Parse a raw LSD packet into its race number, runners and margins message.
+
+    Frames ending in \\x05 with no "Race:" are message-only (margins); anything
+    else is scanned once from the first "Race: <n>" onwards for runner entries.
+    """
+    if not raw:
+        return ParsedMessage(None, [], None)
+
+    if raw.endswith("\x05") and "Race:" not in raw:
+        clean = raw.replace("\x05", "").strip()
+        timestamp_match = _TIMESTAMP_PREFIX.match(clean)
+        if timestamp_match:
+            clean = timestamp_match.group(1)
+        return ParsedMessage(None, [], clean)
+
+    race_match = _RACE.search(raw)
+    if not race_match:
+        return ParsedMessage(None, [], None)
+
+    clean = raw[race_match.start():].replace("\r", "").replace("\n", " ")
+    runners = _RUNNER.findall(clean)
+    # Read the number back from the cleaned text: dropping \r can join digits
+    return ParsedMessage(_RACE.match(clean).group(1), runners, None)
@@ -0,0 +1,99 @@
+# persistence.py
+import asyncio
+import json
+import logging
+import os
+import tempfile
+
+# Seconds between background flushes of pending snapshots
+FLUSH_INTERVAL = float(os.getenv("RESULTS_FLUSH_INTERVAL", "1.0"))
+
+logger = logging.getLogger("lsd.persistence")
+
+# Latest unwritten snapshot per file; newer updates replace older ones
+_pending = {}
+_flush_task = None
+_flush_lock = asyncio.Lock()
+
+stats = {
+    "scheduled": 0,
+    "written": 0,
+    "coalesced": 0,
+    "errors": 0,
+}
+
+
+def write_atomic(filename: str, data: dict):
+    """Write JSON to a temp file beside the target, then rename it into place."""
+    directory = os.path.dirname(os.path.abspath(filename))
+    fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=".tmp_", suffix=".json")
+    try:
+        with os.fdopen(fd, "w") as f:
+            json.dump(data, f, indent=2)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, filename)
+    except BaseException:
+        try:
+            os.unlink(tmp_path)
+        except OSError:
+            pass
+        raise
+
+
+def schedule(filename: str, data: dict):
+    """Queue a snapshot for writing, replacing any not yet written for the same file."""
+    stats["scheduled"] += 1
+    if filename in _pending:
+        stats["coalesced"] += 1
+    _pending[filename] = data
+
+
+def _write_batch(batch: dict) -> dict:
+    failed = {}
+    for filename, data in batch.items():
+        try:
+            write_atomic(filename, data)
+            stats["written"] += 1
+        except Exception as e:
+            stats["errors"] += 1
+            logger.error("Failed to write %s: %s", filename, e)
+            failed[filename] = data
+    return failed
+
+
+async def flush():
+    """Write every pending snapshot now."""
+    global _pending
+    async with _flush_lock:
+        if not _pending:
+            return
+        batch, _pending = _pending, {}
+        failed = await asyncio.to_thread(_write_batch, batch)
+        for filename, data in failed.items():
+            # Retry on the next flush unless a newer snapshot has arrived
+            _pending.setdefault(filename, data)
+
+
+async def _flush_loop():
+    while True:
+        await asyncio.sleep(FLUSH_INTERVAL)
+        # Shielded so cancelling the loop never abandons a half-finished batch
+        await asyncio.shield(flush())
+
+
+def start():
+    global _flush_task
+    _flush_task = asyncio.get_running_loop().create_task(_flush_loop())
+
+
+async def stop():
+    global _flush_task
+    if _flush_task is not None:
+        _flush_task.cancel()
+        try:
+            await _flush_task
+        except asyncio.CancelledError:
+            pass
+        _flush_task = None
+    await flush()
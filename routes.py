@@ -1,21 +1,41 @@
 # routes.py
 from fastapi import Request, Form, Depends, HTTPException, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, RedirectResponse, FileResponse
-from scoreboard import broadcast_scoreboard
+from fastapi.responses import HTMLResponse, PlainTextResponse, RedirectResponse, StreamingResponse
+from scoreboard import broadcast_scoreboard, broadcast_event
 from fastapi.security import HTTPBasic, HTTPBasicCredentials
 from fastapi.routing import APIRouter
 from sqlmodel import Session, select
+from sqlmodel.ext.asyncio.session import AsyncSession
 from passlib.hash import bcrypt
-import secrets
-import os
 import json
+import math
+import os
+import secrets
+import time
+from typing import Optional
 from datetime import date, datetime, timedelta
 
-from database import engine
-from models import Club, Venue, Result, DayPass
+import admission
+import assets
+import broker
+import history
+import hub
+import logs
+import metrics
+import state
+from auth import verify_password, verify_password_async
+from daypass import day_pass_due, record_day_pass, daypass_stats, month_range, export_chunks
+import persistence
+from database import engine, async_engine
+from models import Club, Venue, Result
 from fastapi.templating import Jinja2Templates
 from fastapi import Query
-import re
+from parsing import parse_raw_message
+
+try:
+    import msgpack
+except ImportError:
+    msgpack = None
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
@@ -23,12 +43,24 @@ templates = Jinja2Templates(directory="templates")
 ADMIN_USERNAME = "Felix"
 ADMIN_PASSWORD = bcrypt.hash("1973")
 
-websocket_connections = {}
+submit_stats = {
+    "received": 0,
+    "unchanged": 0,
+    "batches": 0,
+}
+
+# Updates accepted in one /submit/{club_id}/batch request
+BATCH_MAX_ITEMS = int(os.getenv("SUBMIT_BATCH_MAX", "1000"))
+MSGPACK_TYPES = ("application/msgpack", "application/x-msgpack")
+# Batch items skip model validation, but every field the fold reads must be a string like in Result
+BATCH_TEXT_FIELDS = ("raw_message", "venue_name", "correct_weight", "track_condition", "message2", "timestamp")
 
-def verify_admin(credentials: HTTPBasicCredentials = Depends(HTTPBasic())):
+submit_seconds = metrics.Histogram("lsd_submit_seconds", "Submit handling time by stage", ("stage",))
+
+async def verify_admin(credentials: HTTPBasicCredentials = Depends(HTTPBasic())):
     if not secrets.compare_digest(credentials.username, ADMIN_USERNAME):
         raise HTTPException(status_code=401, detail="Invalid username")
-    if not bcrypt.verify(credentials.password, ADMIN_PASSWORD):
+    if not await verify_password_async(credentials.password, ADMIN_PASSWORD):
         raise HTTPException(status_code=401, detail="Invalid password")
     return credentials.username
 
@@ -39,120 +71,158 @@ def login(credentials: dict):
 
     with Session(engine) as session:
         club = session.exec(select(Club).where(Club.username == username)).first()
-        if not club or not bcrypt.verify(password, club.password_hash):
+        if not club or not verify_password(password, club.password_hash):
             raise HTTPException(status_code=401, detail="Invalid login")
 
         venues = session.exec(select(Venue).where(Venue.club_id == club.id)).all()
         return {"club_id": club.id, "venues": [v.name for v in venues]}
 
-def parse_raw_message(raw: str):
-    race_no = None
-    runners = []
-    message1 = None
-
-    if not raw:
-        return race_no, runners, message1
+def merge_update(existing_data: dict, result_data: dict, parsed) -> dict:
+    """The club state after one update; fields the update leaves out keep their old values."""
+    return {
+        "race_no": parsed.race_no or existing_data.get("race_no", ""),
+        "runners": parsed.runner_lines or existing_data.get("runners", []),
+        "correct_weight": result_data.get("correct_weight", existing_data.get("correct_weight", "No")),
+        "track_condition": result_data.get("track_condition", existing_data.get("track_condition", "Good 4")),
+        "venue_name": result_data.get("venue_name", "Venue Name"),
+        "message1": parsed.message1 if parsed.message1 is not None else existing_data.get("message1", ""),
+        "message2": result_data.get("message2", existing_data.get("message2", ""))
+    }
 
-    if raw.endswith("\x05") and "Race:" not in raw:
-        clean = raw.replace("\x05", "").strip()
-        timestamp_match = re.match(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\]\s*(.*)", clean)
-        if timestamp_match:
-            clean = timestamp_match.group(1)
-        message1 = clean
-        return None, [], message1
 
-    raw = raw.strip()
-    raw = re.sub(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\]\s*", "", raw)
+async def publish_state(club_id: int, updated_result: dict, started: float):
+    """Persist a changed state, then record the day pass and broadcast, timing each stage.
 
-    match = re.search(r"(Race:\s*\d+.*)", raw, re.DOTALL)
-    if match:
-        raw = match.group(1)
-    else:
-        return None, [], None
+    The state is saved straight away; the day pass and broadcast go through
+    the club's admission mailbox, so a flood of updates is sent at a capped
+    rate with only the latest state.
+    """
+    state.set_state(club_id, updated_result)
+    submit_seconds.observe(time.perf_counter() - started, "persist")
 
-    clean = raw.replace("\r", "").replace("\n", " ")
+    async def announce():
+        announced_at = time.perf_counter()
+        if day_pass_due(club_id):
+            await record_day_pass(club_id)
+        day_pass_at = time.perf_counter()
+        submit_seconds.observe(day_pass_at - announced_at, "daypass")
 
-    race_match = re.search(r"Race:\s*(\d+)", clean)
-    if race_match:
-        race_no = race_match.group(1)
+        await broadcast_scoreboard(club_id, state.get_state(club_id), channels=(hub.LISTENER, hub.SCOREBOARD))
+        submit_seconds.observe(time.perf_counter() - day_pass_at, "broadcast")
 
-    entries = re.findall(r"Place:(\d*)\s+HorseID:(\d+)\s+Time:([0-9:.]*)", clean)
+    return await admission.admit(club_id, announce)
 
-    for place, horse_id, time in entries:
-        time_display = time.strip() if time.strip() else "—"
-        runners.append(f"{horse_id} - {time_display}")
 
-    return race_no, runners, None
+def check_admission(club_id: int):
+    """Turn away a club whose waiting broadcast has already absorbed too many updates."""
+    wait = admission.retry_after(club_id)
+    if wait is not None:
+        raise HTTPException(
+            status_code=429,
+            detail="Too many updates; only the latest state is needed",
+            headers={"Retry-After": str(max(1, math.ceil(wait)))},
+        )
 
-def record_day_pass(club_id: int):
-    now = datetime.utcnow()
-    with Session(engine) as session:
-        recent = session.exec(
-            select(DayPass)
-            .where(DayPass.club_id == club_id)
-            .order_by(DayPass.timestamp.desc())
-        ).first()
-
-        if not recent or now - recent.timestamp > timedelta(hours=24):
-            club = session.get(Club, club_id)
-            club_name = club.name if club else ""
-            session.add(DayPass(club_id=club_id, club_name=club_name, timestamp=now))
-            session.commit()
 
 @router.post("/submit/{club_id}")
 async def submit_result(club_id: int, result: Result):
+    check_admission(club_id)
     result_data = result.dict()
-    print(f"Incoming data for club {club_id}: {result_data}")
-
-    race_num, runners, message1 = parse_raw_message(result_data.get("raw_message", ""))
+    logs.log_packet(club_id, result_data)
+
+    started = time.perf_counter()
+    parsed = parse_raw_message(result_data.get("raw_message", ""))
+    parsed_at = time.perf_counter()
+    submit_seconds.observe(parsed_at - started, "parse")
+
+    existing_data = await state.fetch_state(club_id)
+    updated_result = merge_update(existing_data, result_data, parsed)
+
+    submit_stats["received"] += 1
+    if updated_result == existing_data:
+        # Identical re-send: acknowledge without persisting or broadcasting
+        submit_stats["unchanged"] += 1
+        if day_pass_due(club_id):
+            await record_day_pass(club_id)
+        submit_seconds.observe(time.perf_counter() - started, "total")
+        return {"status": "ok", "unchanged": True}
+
+    history.record(club_id, updated_result, result_data.get("timestamp"))
+    if not await publish_state(club_id, updated_result, parsed_at):
+        return {"status": "ok", "deferred": True}
+    submit_seconds.observe(time.perf_counter() - started, "total")
+    return {"status": "ok"}
 
-    filename = f"results_club_{club_id}.json"
 
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            existing_data = json.load(f)
+@router.post("/submit/{club_id}/batch")
+async def submit_batch(club_id: int, request: Request):
+    """Apply an ordered list of updates in one pass.
+
+    The body is a JSON array of submit payloads, or the same array in
+    MessagePack with Content-Type application/msgpack. Each update is
+    folded into the state in turn, but only the final state is persisted
+    and broadcast. The response acknowledges every item by index.
+    """
+    check_admission(club_id)
+    body = await request.body()
+    if request.headers.get("content-type", "").split(";")[0].strip() in MSGPACK_TYPES:
+        if msgpack is None:
+            raise HTTPException(status_code=415, detail="MessagePack is not available on this server")
+        try:
+            updates = msgpack.unpackb(body, raw=False)
+        except Exception:
+            raise HTTPException(status_code=400, detail="Invalid MessagePack body")
     else:
-        existing_data = {}
-
-    venue_name = result_data.get("venue_name", "Venue Name")
-
-    updated_result = {
-        "race_no": race_num or existing_data.get("race_no", ""),
-        "runners": runners if runners else existing_data.get("runners", []),
-        "correct_weight": result_data.get("correct_weight", existing_data.get("correct_weight", "No")),
-        "track_condition": result_data.get("track_condition", existing_data.get("track_condition", "Good 4")),
-        "venue_name": venue_name,
-        "message1": message1 if message1 is not None else existing_data.get("message1", ""),
-        "message2": result_data.get("message2", existing_data.get("message2", ""))
-    }
-
-    with open(filename, "w") as f:
-        json.dump(updated_result, f, indent=2)
-
-    record_day_pass(club_id)
-
-    if club_id in websocket_connections:
-        for connection in websocket_connections[club_id]:
-            try:
-                await connection.send_json(updated_result)
-            except:
-                continue
-
-    await broadcast_scoreboard(club_id, updated_result)
-
-    return {"status": "ok"}
+        try:
+            updates = json.loads(body)
+        except ValueError:
+            raise HTTPException(status_code=400, detail="Invalid JSON body")
+    if not isinstance(updates, list):
+        raise HTTPException(status_code=400, detail="Expected an array of updates")
+    if len(updates) > BATCH_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_ITEMS} updates per batch")
+
+    started = time.perf_counter()
+    existing_data = await state.fetch_state(club_id)
+    current = existing_data
+    acks = []
+    for index, result_data in enumerate(updates):
+        if not isinstance(result_data, dict):
+            acks.append({"index": index, "status": "error", "detail": "Not a submit payload"})
+            continue
+        invalid = [field for field in BATCH_TEXT_FIELDS if field in result_data and not isinstance(result_data[field], str)]
+        if invalid:
+            acks.append({"index": index, "status": "error", "detail": f"Must be strings: {', '.join(invalid)}"})
+            continue
+        logs.log_packet(club_id, result_data)
+        updated_result = merge_update(current, result_data, parse_raw_message(result_data.get("raw_message", "")))
+        if updated_result == current:
+            submit_stats["unchanged"] += 1
+            acks.append({"index": index, "status": "ok", "unchanged": True})
+        else:
+            current = updated_result
+            # Every race in the batch reaches the history, not just the last
+            history.record(club_id, updated_result, result_data.get("timestamp"))
+            acks.append({"index": index, "status": "ok"})
+    submit_stats["received"] += len(updates)
+    submit_stats["batches"] += 1
+    parsed_at = time.perf_counter()
+    submit_seconds.observe(parsed_at - started, "parse")
+
+    if current is existing_data:
+        if day_pass_due(club_id):
+            await record_day_pass(club_id)
+        deferred = False
+    else:
+        deferred = not await publish_state(club_id, current, parsed_at)
+    submit_seconds.observe(time.perf_counter() - started, "batch")
+    return {"status": "ok", "changed": current is not existing_data, "deferred": deferred, "acks": acks}
 
 
 @router.post("/initialise/{club_id}")
 async def initialise_state(club_id: int):
     try:
-        filename = f"results_club_{club_id}.json"
-
-        if os.path.exists(filename):
-            with open(filename, "r") as f:
-                existing_data = json.load(f)
-        else:
-            existing_data = {}
+        existing_data = await state.fetch_state(club_id)
 
         updated_result = {**existing_data}
         updated_result["message1"] = ""
@@ -160,9 +230,7 @@ async def initialise_state(club_id: int):
         updated_result["correct_weight"] = "No"
         updated_result["raw_message"] = "[Initialise command received]"
 
-
-        with open(filename, "w") as f:
-            json.dump(updated_result, f, indent=2)
+        state.set_state(club_id, updated_result)
 
         await broadcast_scoreboard(club_id, updated_result)
         return {"success": True}
@@ -173,15 +241,15 @@ async def initialise_state(club_id: int):
 @router.websocket("/ws/{club_id}")
 async def websocket_endpoint(websocket: WebSocket, club_id: int):
     await websocket.accept()
-    if club_id not in websocket_connections:
-        websocket_connections[club_id] = []
-    websocket_connections[club_id].append(websocket)
+    subscriber = hub.subscribe(club_id, websocket, hub.LISTENER)
 
     try:
         while True:
             await websocket.receive_text()
     except WebSocketDisconnect:
-        websocket_connections[club_id].remove(websocket)
+        pass
+    finally:
+        hub.unsubscribe(subscriber)
 
 @router.get("/admin", response_class=HTMLResponse)
 def admin_dashboard(request: Request, username: str = Depends(verify_admin)):
@@ -194,6 +262,33 @@ def admin_dashboard(request: Request, username: str = Depends(verify_admin)):
         "venues": venues
     })
 
+@router.get("/admin/stats")
+def admin_stats(username: str = Depends(verify_admin)):
+    return {
+        "submit": dict(submit_stats),
+        "persistence": dict(persistence.stats),
+        "history": dict(history.stats),
+        "admission": dict(admission.stats),
+        "hub": dict(hub.stats),
+        "clubs": hub.club_stats(),
+        "broker": {"backend": broker.BROADCAST_BACKEND, "worker": broker.WORKER_ID},
+    }
+
+@router.get("/assets/{digest}/{name}", include_in_schema=False)
+def static_asset(request: Request, digest: str, name: str):
+    asset = assets.static_asset(name, digest)
+    if asset is None:
+        try:
+            # An old hash from a page loaded before a deploy: point it at the current file
+            return RedirectResponse(url=assets.asset_url(name), status_code=307)
+        except KeyError:
+            raise HTTPException(status_code=404, detail="Not found")
+    return asset.respond(request)
+
+@router.get("/metrics", response_class=PlainTextResponse)
+def metrics_endpoint(username: str = Depends(verify_admin)):
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
+
 def register_routes(app):
     @app.get("/", include_in_schema=False)
     def root_redirect():
@@ -208,45 +303,49 @@ def daypass_dashboard(request: Request, username: str = Depends(verify_admin)):
     return templates.TemplateResponse("daypass_dashboard.html", {"request": request, "clubs": clubs})
 
 @router.get("/admin/daypass_data")
-def get_daypass_data(club_id: int = Query(...)):
-    with Session(engine) as session:
-        logs = session.exec(
-            select(DayPass).where(DayPass.club_id == club_id).order_by(DayPass.timestamp.desc())
-        ).all()
-        now = datetime.utcnow()
-        month_total = sum(1 for p in logs if p.timestamp.month == now.month and p.timestamp.year == now.year)
-        all_time_total = len(logs)
-        last_30 = [
-            {
-                "club": p.club_name,
-                "timestamp": p.timestamp.strftime("%Y-%m-%d %H:%M:%S"),
-            }
-            for p in logs[:30]
-        ]
-    return {
-        "all_time": all_time_total,
-        "this_month": month_total,
-        "recent_logs": last_30
-    }
+def get_daypass_data(club_id: int = Query(...), username: str = Depends(verify_admin)):
+    return daypass_stats(club_id)
 
 @router.get("/admin/daypass_export")
-def export_daypasses(club_id: int = Query(...), year: int = Query(...), month: int = Query(...)):
-    with Session(engine) as session:
-        logs = session.exec(
-            select(DayPass).where(
-                DayPass.club_id == club_id,
-                DayPass.timestamp.month == month,
-                DayPass.timestamp.year == year
-            ).order_by(DayPass.timestamp.asc())
-        ).all()
-    lines = [
-        f"{p.timestamp.strftime('%Y-%m-%d %H:%M:%S')} - {p.club_name}"
-        for p in logs
-    ]
-    export_file = f"export_daypasses_{club_id}_{year}_{month}.txt"
-    with open(export_file, "w") as f:
-        f.write("\n".join(lines))
-    return FileResponse(export_file, filename=export_file, media_type="text/plain")
+def export_daypasses(
+    club_id: Optional[int] = Query(None),
+    year: Optional[int] = Query(None, ge=1, le=9998),
+    month: Optional[int] = Query(None, ge=1, le=12),
+    start: Optional[date] = Query(None),
+    end: Optional[date] = Query(None),
+    format: str = Query("txt"),
+    username: str = Depends(verify_admin),
+):
+    """Stream day passes for one club, or every club when club_id is omitted.
+
+    Filter by year and month, by an inclusive start/end date range, or by
+    both, in which case start/end narrow the month.
+    """
+    if format not in ("txt", "csv"):
+        raise HTTPException(status_code=400, detail="format must be txt or csv")
+    if (year is None) != (month is None):
+        raise HTTPException(status_code=400, detail="year and month must be given together")
+
+    range_start = range_end = None
+    if year is not None and month is not None:
+        range_start, range_end = month_range(year, month)
+    if start is not None:
+        start_at = datetime.combine(start, datetime.min.time())
+        range_start = start_at if range_start is None else max(range_start, start_at)
+    if end is not None:
+        end_before = datetime.combine(end + timedelta(days=1), datetime.min.time())
+        range_end = end_before if range_end is None else min(range_end, end_before)
+
+    period = f"{year}_{month}" if year is not None else ""
+    if start is not None or end is not None:
+        period = "_".join(filter(None, (period, f"{start or 'start'}_{end or 'end'}")))
+    export_file = f"export_daypasses_{club_id if club_id is not None else 'all'}_{period}.{format}"
+    media_type = "text/csv" if format == "csv" else "text/plain"
+    return StreamingResponse(
+        export_chunks(format, club_id, range_start, range_end),
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{export_file}"'},
+    )
 
 @router.post("/admin/add_club", response_class=RedirectResponse)
 def add_club(
@@ -279,24 +378,39 @@ async def delete_venue(request: Request):
     data = await request.json()
     venue_id = data.get("venue_id")
 
-    with Session(engine) as session:
-        venue = session.get(Venue, venue_id)
+    async with AsyncSession(async_engine) as session:
+        venue = await session.get(Venue, venue_id)
         if venue:
             club_id = venue.club_id
-            session.delete(venue)
-            session.commit()
-            await broadcast_scoreboard(club_id, {"action": "delete_venue", "venue_id": venue_id})
+            await session.delete(venue)
+            await session.commit()
+            await broadcast_event(club_id, {"action": "delete_venue", "venue_id": venue_id})
     return {"status": "ok"}
 
+@router.get("/admin/history/{club_id}")
+async def admin_history(
+    club_id: int,
+    limit: int = Query(history.PAGE_SIZE),
+    before: Optional[int] = Query(None),
+    username: str = Depends(verify_admin),
+):
+    return await history.recent_races(club_id, limit, before)
+
+@router.get("/admin/history/{club_id}/{race_date}")
+async def admin_meeting(
+    club_id: int,
+    race_date: date,
+    venue: Optional[str] = Query(None),
+    username: str = Depends(verify_admin),
+):
+    return {"races": await history.meeting_results(club_id, race_date, venue)}
+
 @router.get("/admin/results/{club_id}", response_class=HTMLResponse)
 def admin_results(request: Request, club_id: int, username: str = Depends(verify_admin)):
-    filename = f"results_club_{club_id}.json"
-    if not os.path.exists(filename):
+    all_data = state.get_state(club_id)
+    if not all_data:
         return templates.TemplateResponse("admin_results.html", {"request": request, "result": None})
 
-    with open(filename, "r") as f:
-        all_data = json.load(f)
-
     return templates.TemplateResponse("admin_results.html", {"request": request, "result": all_data})
 
 
@@ -1,24 +1,42 @@
 # scoreboard.py
 from fastapi import APIRouter, Request, Form, Depends, HTTPException, Response, WebSocket, WebSocketDisconnect
-from fastapi.responses import HTMLResponse, RedirectResponse
+from fastapi.responses import HTMLResponse, RedirectResponse, StreamingResponse
 from fastapi.templating import Jinja2Templates
 from sqlmodel import Session, select
 from starlette.middleware.sessions import SessionMiddleware
-from passlib.hash import bcrypt
-from starlette.websockets import WebSocketState
 import secrets
-import os
 import json
-from datetime import datetime
+import os
+from collections import deque
+from datetime import date
+from typing import Optional
 
+import assets
+import broker
+import history
+import hub
+import state
+from auth import verify_password
 from database import engine
 from models import Club
 
 router = APIRouter()
 templates = Jinja2Templates(directory="templates")
 
-# Store WebSocket connections for scoreboards
-scoreboard_connections = {}
+# Last state sent to displays per club: {club_id: {"seq": int, "data": dict}}
+scoreboard_versions = {}
+
+# Recent delta frames per club so a reconnecting display can catch up
+REPLAY_BUFFER_SIZE = int(os.getenv("SCOREBOARD_REPLAY_BUFFER", "64"))
+scoreboard_replay = {}
+
+# Seconds between keep-alive comments on an idle event stream
+SSE_KEEPALIVE = float(os.getenv("SSE_KEEPALIVE", "15"))
+# Seconds a long-poll request is held open waiting for a change
+LONG_POLL_TIMEOUT = float(os.getenv("LONG_POLL_TIMEOUT", "25"))
+
+# Sequence numbers restart with the process; displays only resume within one epoch
+EPOCH = secrets.token_hex(4)
 
 # Scoreboard login page
 @router.get("/scoreboard", response_class=HTMLResponse)
@@ -36,7 +54,7 @@ def scoreboard_login(
 ):
     with Session(engine) as session:
         club = session.exec(select(Club).where(Club.username == username)).first()
-        if not club or not bcrypt.verify(password, club.password_hash):
+        if not club or not verify_password(password, club.password_hash):
             raise HTTPException(status_code=401, detail="Invalid login")
 
         request.session["club_id"] = club.id
@@ -54,59 +72,190 @@ def scoreboard_view(request: Request):
     if not club_id:
         return RedirectResponse(url="/scoreboard")
 
-    filename = f"results_club_{club_id}.json"
-    result = {}
-    if os.path.exists(filename):
-        with open(filename, "r") as f:
-            all_results = json.load(f)
+    # The page is the same for every club; the state arrives as the first socket frame
+    return assets.display_shell(templates).respond(request)
 
-        if isinstance(all_results, dict) and all_results:
-            ts_str = all_results.get("timestamp")
+def _current_version(club_id: int) -> dict:
+    version = scoreboard_versions.get(club_id)
+    if version is None:
+        version = {"seq": 0, "data": dict(state.get_state(club_id))}
+        scoreboard_versions[club_id] = version
+    return version
 
-            try:
-                ts = datetime.fromisoformat(ts_str)
-            except Exception:
-                ts = None
+def snapshot_frame(club_id: int) -> dict:
+    version = _current_version(club_id)
+    return {"type": "snapshot", "epoch": EPOCH, "seq": version["seq"], "data": version["data"]}
+
+def replay_since(club_id: int, since: int):
+    """Return the deltas after since, or None if they are no longer buffered."""
+    version = scoreboard_versions.get(club_id)
+    if version is None or since > version["seq"]:
+        return None
+    if since == version["seq"]:
+        return []
+    frames = scoreboard_replay.get(club_id)
+    if not frames or frames[0]["seq"] > since + 1:
+        return None
+    return [frame for frame in frames if frame["seq"] > since]
 
-            result = all_results  # flat structure now
+def _diff(old: dict, new: dict):
+    changes = {key: value for key, value in new.items() if key not in old or old[key] != value}
+    removed = [key for key in old if key not in new]
+    return changes, removed
 
-    return templates.TemplateResponse("scoreboard_display.html", {"request": request, "club_id": club_id, "result": result})
+def send_catch_up(subscriber, since: Optional[int], epoch: Optional[str]):
+    """Queue the deltas a resuming display missed, or a full snapshot if they're gone."""
+    missed = replay_since(subscriber.club_id, since) if since is not None and epoch == EPOCH else None
+    if missed is None:
+        subscriber.send_snapshot(snapshot_frame(subscriber.club_id))
+    else:
+        for frame in missed:
+            subscriber.send(frame)
+
+def version_etag(club_id: int) -> str:
+    return f'"{EPOCH}-{_current_version(club_id)["seq"]}"'
 
 # WebSocket for scoreboard
 @router.websocket("/scoreboard/ws/{club_id}")
-async def scoreboard_ws(websocket: WebSocket, club_id: int):
+async def scoreboard_ws(websocket: WebSocket, club_id: int, since: Optional[int] = None, epoch: Optional[str] = None):
     await websocket.accept()
-    if club_id not in scoreboard_connections:
-        scoreboard_connections[club_id] = []
-    scoreboard_connections[club_id].append(websocket)
+    await state.fetch_state(club_id)  # load a cold club off the event loop
+    subscriber = hub.subscribe(club_id, websocket, hub.SCOREBOARD)
+    send_catch_up(subscriber, since, epoch)
     try:
         while True:
-            await websocket.receive_text()  # keep-alive only
-    except WebSocketDisconnect:
-        scoreboard_connections[club_id].remove(websocket)
-
-# External broadcast function (to be imported where needed)
-async def broadcast_to_scoreboard(club_id: int, result_data: dict):
-    if club_id in scoreboard_connections:
-        for ws in scoreboard_connections[club_id]:
+            message = await websocket.receive_text()  # "ping" keep-alives or protocol requests
+            if not message.startswith("{"):
+                continue
             try:
-                await ws.send_json(result_data)
-            except:
+                request = json.loads(message)
+            except ValueError:
                 continue
+            if request.get("type") == "resync":
+                subscriber.send_snapshot(snapshot_frame(club_id))
+    except WebSocketDisconnect:
+        pass
+    finally:
+        hub.unsubscribe(subscriber)
+
+async def _event_stream(subscriber):
+    try:
+        while True:
+            frame = await subscriber.receive(SSE_KEEPALIVE)
+            # A comment line keeps proxies from timing out an idle stream
+            yield ": keepalive\n\n" if frame is None else f"data: {frame}\n\n"
+    finally:
+        hub.unsubscribe(subscriber)
+
+# Server-Sent Events for displays that can't hold a WebSocket open; same frames as /scoreboard/ws
+@router.get("/scoreboard/sse/{club_id}")
+async def scoreboard_sse(club_id: int, since: Optional[int] = None, epoch: Optional[str] = None):
+    await state.fetch_state(club_id)
+    subscriber = hub.subscribe_stream(club_id, hub.SCOREBOARD)
+    send_catch_up(subscriber, since, epoch)
+    return StreamingResponse(
+        _event_stream(subscriber),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+# Long-poll fallback: send the ETag from the last reply as If-None-Match and the
+# request is held until the state changes, then answered with a fresh snapshot
+@router.get("/scoreboard/poll/{club_id}")
+async def scoreboard_poll(request: Request, club_id: int):
+    await state.fetch_state(club_id)
+    if request.headers.get("if-none-match") == version_etag(club_id):
+        subscriber = hub.subscribe_stream(club_id, hub.SCOREBOARD)
+        try:
+            frame = await subscriber.receive(LONG_POLL_TIMEOUT)
+        finally:
+            hub.unsubscribe(subscriber)
+        if frame is None:
+            return Response(status_code=304, headers={"ETag": version_etag(club_id)})
+    return Response(
+        hub.encode_json(snapshot_frame(club_id)),
+        media_type="application/json",
+        headers={"ETag": version_etag(club_id), "Cache-Control": "no-cache"},
+    )
+
+# Finished races for the logged-in club, newest first
+@router.get("/scoreboard/history")
+async def scoreboard_history(request: Request, limit: int = history.PAGE_SIZE, before: Optional[int] = None):
+    club_id = request.session.get("club_id")
+    if not club_id:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    return await history.recent_races(club_id, limit, before)
+
+# One meeting's results for the logged-in club
+@router.get("/scoreboard/history/{race_date}")
+async def scoreboard_meeting(request: Request, race_date: date, venue: Optional[str] = None):
+    club_id = request.session.get("club_id")
+    if not club_id:
+        raise HTTPException(status_code=401, detail="Not logged in")
+    return {"races": await history.meeting_results(club_id, race_date, venue)}
 
 # Register scoreboard routes
 def register_scoreboard(app):
     app.include_router(router)
 
 
-async def broadcast_scoreboard(club_id: int, data: dict):
-    """Send data to all connected scoreboards for the given club."""
-    if club_id in scoreboard_connections:
-        disconnected = []
-        for ws in scoreboard_connections[club_id]:
-            if ws.application_state == WebSocketState.CONNECTED:
-                await ws.send_json(data)
-            else:
-                disconnected.append(ws)
-        for ws in disconnected:
-            scoreboard_connections[club_id].remove(ws)
+async def broadcast_scoreboard(club_id: int, data: dict, channels=(hub.SCOREBOARD,)):
+    """Send data to all connected scoreboards for the given club.
+
+    Goes through the broadcast broker, so displays connected to other
+    workers get it too, along with the new state.
+    """
+    await broker.publish({"type": "state", "club_id": club_id, "data": data, "channels": list(channels)})
+
+
+async def broadcast_event(club_id: int, event: dict):
+    """Send a one-off notice to displays without touching the versioned state."""
+    await broker.publish({"type": "event", "club_id": club_id, "event": event})
+
+
+async def deliver_broadcast(message: dict):
+    """Fan a broker message out to this worker's sockets.
+
+    /ws listeners get the full state. Displays get a numbered delta of the
+    fields that changed since the previous update; they receive a full
+    snapshot on connect (or the buffered deltas they missed when resuming)
+    and can ask for another snapshot if they miss a number.
+    Sends are queued per socket, so this never waits on a slow display.
+    """
+    club_id = message["club_id"]
+    if message["type"] == "event":
+        hub.publish(club_id, {"type": "event", **message["event"]}, (hub.SCOREBOARD,))
+        return
+
+    data = message["data"]
+    channels = message["channels"]
+    # Keeps every worker's copy of the state current; only the sender persists it
+    state.remember(club_id, data)
+
+    if hub.LISTENER in channels:
+        hub.publish(club_id, data, (hub.LISTENER,))
+    if hub.SCOREBOARD not in channels:
+        return
+
+    version = scoreboard_versions.get(club_id)
+    if version is None:
+        # No display has connected yet; the first one gets this as its snapshot
+        scoreboard_versions[club_id] = {"seq": 0, "data": dict(data)}
+        return
+
+    changes, removed = _diff(version["data"], data)
+    if not changes and not removed:
+        return
+
+    version["seq"] += 1
+    version["data"] = dict(data)
+    frame = {"type": "delta", "seq": version["seq"], "changes": changes}
+    if removed:
+        frame["removed"] = removed
+    if club_id not in scoreboard_replay:
+        scoreboard_replay[club_id] = deque(maxlen=REPLAY_BUFFER_SIZE)
+    scoreboard_replay[club_id].append(frame)
+    hub.publish(club_id, frame, (hub.SCOREBOARD,))
+
+
+broker.set_handler(deliver_broadcast)
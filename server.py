@@ -1,8 +1,14 @@
 # main.py
 from fastapi import FastAPI
 from fastapi.templating import Jinja2Templates
-from sqlmodel import SQLModel
-from database import engine
+import database
+import state
+import persistence
+import history
+import daypass
+import assets
+import broker
+import logs
 from routes import register_routes
 from scoreboard import router as scoreboard_router
 from scoreboard import register_scoreboard
@@ -21,13 +27,26 @@ app.add_middleware(SessionMiddleware, secret_key="supersecretkey")
 
 @app.on_event("startup")
 def on_startup():
-    SQLModel.metadata.create_all(engine)
-    # Ensure new columns exist for older databases
-    with engine.begin() as conn:
-        info = conn.exec_driver_sql("PRAGMA table_info(daypass)").fetchall()
-        cols = [row[1] for row in info]
-        if "club_name" not in cols:
-            conn.exec_driver_sql("ALTER TABLE daypass ADD COLUMN club_name TEXT")
+    logs.setup()
+    database.migrate()
+    state.load_all()
+    assets.load_static()
+    daypass.backfill_monthly()
+    daypass.warm_cache()
+
+@app.on_event("startup")
+async def start_background_tasks():
+    persistence.start()
+    history.start()
+    await broker.start()
+
+@app.on_event("shutdown")
+async def on_shutdown():
+    await broker.stop()
+    await persistence.stop()
+    await history.stop()
+    await database.async_engine.dispose()
+    logs.stop()
 
 
 register_routes(app)
@@ -35,4 +54,4 @@ register_scoreboard(app)
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
+    uvicorn.run("server:app", host="0.0.0.0", port=8000, reload=True, ws_per_message_deflate=True)
@@ -0,0 +1,65 @@
+# state.py
+import asyncio
+import glob
+import json
+import os
+import re
+
+import persistence
+
+# Latest scoreboard snapshot per club, served from memory
+club_states = {}
+
+
+def results_filename(club_id: int) -> str:
+    return f"results_club_{club_id}.json"
+
+
+def _load(club_id: int) -> dict:
+    filename = results_filename(club_id)
+    if not os.path.exists(filename):
+        return {}
+    try:
+        with open(filename, "r") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return {}
+    return data if isinstance(data, dict) else {}
+
+
+def load_all():
+    """Warm the store from every results file on disk (called at startup)."""
+    for filename in glob.glob("results_club_*.json"):
+        match = re.fullmatch(r"results_club_(\d+)\.json", os.path.basename(filename))
+        if match:
+            club_id = int(match.group(1))
+            club_states[club_id] = _load(club_id)
+
+
+def get_state(club_id: int) -> dict:
+    """Return the current snapshot for a club, reading the disk only when cold."""
+    state = club_states.get(club_id)
+    if state is None:
+        state = _load(club_id)
+        club_states[club_id] = state
+    return state
+
+
+async def fetch_state(club_id: int) -> dict:
+    """Async variant of get_state that keeps cold loads off the event loop."""
+    state = club_states.get(club_id)
+    if state is None:
+        state = await asyncio.to_thread(_load, club_id)
+        state = club_states.setdefault(club_id, state)
+    return state
+
+
+def remember(club_id: int, data: dict):
+    """Replace a club's snapshot in memory only, e.g. one another worker persisted."""
+    club_states[club_id] = data
+
+
+def set_state(club_id: int, data: dict):
+    """Replace a club's snapshot and write it back in the background."""
+    club_states[club_id] = data
+    persistence.schedule(results_filename(club_id), dict(data))
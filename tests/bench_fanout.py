@@ -0,0 +1,87 @@
+# bench_fanout.py
+"""Per-subscriber cost of a scoreboard broadcast at 1, 10, 100 and 1000 sockets.
+
+Compares encoding each update once in hub.publish against encoding it again
+for every socket, as send_json did. Sockets are no-ops, so this is the
+server's own cost. Run from the repo root: python tests/bench_fanout.py
+"""
+import asyncio
+import json
+import os
+import sys
+import time
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import hub
+
+SOCKET_COUNTS = (1, 10, 100, 1000)
+# Socket-updates per measurement, spread over however many rounds that takes
+WORK = 20000
+CLUB_ID = 1
+
+
+class NullSocket:
+    async def send_text(self, text):
+        pass
+
+    async def close(self):
+        pass
+
+
+def payload() -> dict:
+    """A club state with a full 14-runner field."""
+    return {
+        "race_no": "7",
+        "runners": [f"{horse} - 1:0{horse % 10}.{horse:02d}" for horse in range(1, 15)],
+        "correct_weight": "No",
+        "track_condition": "Good 4",
+        "venue_name": "Addington Raceway",
+        "message1": "Margins: 1/2 LEN, HEAD, NOSE",
+        "message2": "",
+    }
+
+
+def encode_per_socket(subscribers, data):
+    published_at = time.perf_counter()
+    for subscriber in subscribers:
+        subscriber.offer(json.dumps(data, ensure_ascii=False, separators=(",", ":")), published_at)
+
+
+async def measure(count: int, encode_once: bool) -> float:
+    """Microseconds per socket per update, from publish until every socket has sent it."""
+    subscribers = [hub.subscribe(CLUB_ID, NullSocket(), hub.SCOREBOARD) for _ in range(count)]
+    data = payload()
+    rounds = max(20, WORK // count)
+    sent = hub.stats["sent"]
+    started = time.perf_counter()
+    for update in range(rounds):
+        data["message2"] = f"update {update}"
+        if encode_once:
+            hub.publish(CLUB_ID, data)
+        else:
+            encode_per_socket(subscribers, data)
+        sent += count
+        while hub.stats["sent"] < sent:
+            await asyncio.sleep(0)
+    elapsed = time.perf_counter() - started
+    for subscriber in subscribers:
+        hub.unsubscribe(subscriber)
+    await asyncio.sleep(0)
+    return elapsed / (rounds * count) * 1e6
+
+
+async def main():
+    data = payload()
+    encode = min(timeit.repeat(lambda: json.dumps(data, ensure_ascii=False, separators=(",", ":")), number=10000, repeat=5))
+    print(f"json.dumps per update: {encode / 10000 * 1e6:.1f} us; hub.encode_json uses {'orjson' if hub.orjson else 'json'}")
+    print(f"{'sockets':>7}  {'encode per socket':>17}  {'encode once':>11}")
+    for count in SOCKET_COUNTS:
+        per_socket = await measure(count, encode_once=False)
+        once = await measure(count, encode_once=True)
+        print(f"{count:>7}  {per_socket:>14.1f} us  {once:>8.1f} us")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,67 @@
+# bench_journal.py
+"""Time replaying LSD Connect's offline journal against a local stand-in server.
+
+Run from the repo root: python tests/bench_journal.py [entries]
+"""
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "LSD Connect App"))
+
+import LSD_Connect
+from packets import submit
+from stub_server import StubServer
+
+PATH = "/submit/1"
+
+
+def outage(count: int) -> list:
+    """count journal entries as a meeting would produce them: each race's runners, then margins."""
+    entries = []
+    for i in range(count):
+        race = i // 10 + 1
+        if i % 10 == 9:
+            payload = submit(f"Margins: race {race}\x05")
+        else:
+            payload = submit(f"Race: {race}\r\nPlace:1 HorseID:{i % 10} Time:1:0{i % 10}.00\r\n\x05")
+        entries.append({"path": PATH, "payload": payload})
+    return entries
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else LSD_Connect.JOURNAL_MAX_ENTRIES
+    entries = outage(count)
+    compacted = LSD_Connect.OfflineJournal.compact(entries)
+    stub = StubServer()
+    with tempfile.TemporaryDirectory() as work:
+        LSD_Connect.LOG_FILE = os.path.join(work, "error.log")
+        journal = LSD_Connect.OfflineJournal(os.path.join(work, "outbox.jsonl"))
+        sender = LSD_Connect.OutboundSender(base_url=stub.url, journal=journal)
+        sender.stop()
+
+        started = time.perf_counter()
+        for entry in entries:
+            journal.append(entry["path"], entry["payload"])
+        journalled = time.perf_counter() - started
+
+        started = time.perf_counter()
+        delivered = sender.flush_journal()
+        flushed = time.perf_counter() - started
+        batched_requests = len(stub.requests)
+
+        # The same compacted entries posted one request each, for comparison
+        started = time.perf_counter()
+        for entry in compacted:
+            sender.deliver(entry["path"], entry["payload"])
+        single = time.perf_counter() - started
+    stub.close()
+
+    print(f"journalled {count} entries in {journalled * 1000:.1f} ms ({count / journalled:.0f}/s, fsync per append)")
+    print(f"compacted to {len(compacted)}; replayed {delivered} in {batched_requests} requests, {flushed * 1000:.1f} ms")
+    print(f"one request per entry: {len(compacted)} requests, {single * 1000:.1f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,39 @@
+# bench_parsing.py
+"""Time parsing.parse_raw_message against the old routes.py parser.
+
+Run from the repo root: python tests/bench_parsing.py [rounds]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import legacy_parsing
+from packets import load_corpus, random_packets
+from parsing import parse_raw_message
+
+
+def bench(parse, packets, rounds: int) -> float:
+    """Best microseconds per packet over rounds passes of the whole list."""
+    def run():
+        for raw in packets:
+            parse(raw)
+    best = min(timeit.repeat(run, number=1, repeat=rounds))
+    return best / len(packets) * 1e6
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+    sets = {
+        "corpus": [raw for _, raw in load_corpus()],
+        "random": random_packets(5000),
+    }
+    for name, packets in sets.items():
+        old = bench(legacy_parsing.parse_raw_message, packets, rounds)
+        new = bench(parse_raw_message, packets, rounds)
+        print(f"{name:<8} {len(packets):>5} packets  old {old:6.2f} us  new {new:6.2f} us  {old / new:4.2f}x")
+
+
+if __name__ == "__main__":
+    main()
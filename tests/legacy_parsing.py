@@ -0,0 +1,43 @@
+# legacy_parsing.py
+"""The packet parser as it was in routes.py, kept as the reference for parsing.py."""
+import re
+
+
+def parse_raw_message(raw: str):
+    race_no = None
+    runners = []
+    message1 = None
+
+    if not raw:
+        return race_no, runners, message1
+
+    if raw.endswith("\x05") and "Race:" not in raw:
+        clean = raw.replace("\x05", "").strip()
+        timestamp_match = re.match(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\]\s*(.*)", clean)
+        if timestamp_match:
+            clean = timestamp_match.group(1)
+        message1 = clean
+        return None, [], message1
+
+    raw = raw.strip()
+    raw = re.sub(r"^\[\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}\]\s*", "", raw)
+
+    match = re.search(r"(Race:\s*\d+.*)", raw, re.DOTALL)
+    if match:
+        raw = match.group(1)
+    else:
+        return None, [], None
+
+    clean = raw.replace("\r", "").replace("\n", " ")
+
+    race_match = re.search(r"Race:\s*(\d+)", clean)
+    if race_match:
+        race_no = race_match.group(1)
+
+    entries = re.findall(r"Place:(\d*)\s+HorseID:(\d+)\s+Time:([0-9:.]*)", clean)
+
+    for place, horse_id, time in entries:
+        time_display = time.strip() if time.strip() else "—"
+        runners.append(f"{horse_id} - {time_display}")
+
+    return race_no, runners, None
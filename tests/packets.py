@@ -0,0 +1,55 @@
+# packets.py
+"""The recorded packet corpus, seeded random packets built from the same pieces, and sample submits."""
+import json
+import os
+import random
+
+CORPUS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "packets.jsonl")
+
+# Pieces real packets are made of, with the separators the timing system splits them on
+_PIECES = [
+    "[2025-03-08 14:21:07] ", "Race:", "Race: ", "Race: 3", "1", "2", "12",
+    "Place:", "Place:1 ", "HorseID:", "HorseID:7 ", "Time:", "Time:1:02.33", "1:0", "2.41",
+    "Place:1 HorseID:7 Time:1:02.33", "Place:2 HorseID:11 Time:", "Place: HorseID:4 Time:",
+    "\r", "\n", "\r\n", " ", "\x05", "PHOTO", "Margins: HEAD", "–",
+]
+
+
+def load_corpus() -> list:
+    """[(note, raw)] for every packet in tests/data/packets.jsonl."""
+    with open(CORPUS, encoding="utf-8") as f:
+        return [(entry["note"], entry["raw"]) for entry in map(json.loads, f)]
+
+
+def random_packets(count: int, seed: int = 7) -> list:
+    rng = random.Random(seed)
+    packets = []
+    for _ in range(count):
+        raw = "".join(rng.choice(_PIECES) for _ in range(rng.randint(1, 30)))
+        if rng.random() < 0.5:
+            raw += "\x05"
+        packets.append(raw)
+    return packets
+
+
+def submit(frame, **fields):
+    """A submit payload as LSD Connect sends it, carrying one timing frame."""
+    payload = {
+        "club_id": 1,
+        "venue_name": "V",
+        "message1": "",
+        "message2": "",
+        "track_condition": "Good 4",
+        "correct_weight": "No",
+        "raw_message": f"[2025-03-08 14:21:07] {frame}",
+    }
+    payload.update(fields)
+    return payload
+
+
+RACE_4 = submit("Race: 4\r\nPlace:1 HorseID:7 Time:1:02.33\r\n\x05")
+RACE_5_RUNNING = submit("Race: 5\r\nPlace: HorseID:3 Time:\r\n\x05")
+RACE_5 = submit("Race: 5\r\nPlace:1 HorseID:3 Time:1:01.10\r\n\x05")
+MARGINS = submit("Margins: HEAD\x05")
+MARGINS_2 = submit("Margins: 1/2 LEN\x05")
+FORM_ONLY = submit("Command=LayoutDraw;Clear=1;", correct_weight="Yes")
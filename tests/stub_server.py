@@ -0,0 +1,72 @@
+# stub_server.py
+"""A local stand-in for the LSD server that records what LSD Connect posts."""
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+class StubServer:
+    """Records every POST as (path, body, client port) and answers with canned statuses.
+
+    statuses is consumed one per request (200 once it runs out); hold()
+    makes requests wait until release(), to keep one "in flight".
+    """
+
+    def __init__(self):
+        self.requests = []
+        self.statuses = []
+        self.lock = threading.Lock()
+        self.gate = threading.Event()
+        self.gate.set()
+        self.arrived = threading.Condition(self.lock)
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), self._handler())
+        self.httpd.daemon_threads = True
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}"
+        self.thread = threading.Thread(target=self.httpd.serve_forever, args=(0.05,), daemon=True)
+        self.thread.start()
+
+    def _handler(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True
+
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or "null")
+                with stub.arrived:
+                    stub.requests.append((self.path, body, self.client_address[1]))
+                    status = stub.statuses.pop(0) if stub.statuses else 200
+                    stub.arrived.notify_all()
+                stub.gate.wait()
+                reply = b'{"status":"ok"}'
+                self.send_response(status)
+                if status == 429:
+                    self.send_header("Retry-After", "0")
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(reply)))
+                self.end_headers()
+                self.wfile.write(reply)
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
+
+    def hold(self):
+        self.gate.clear()
+
+    def release(self):
+        self.gate.set()
+
+    def wait_for(self, count: int, timeout: float = 5.0) -> list:
+        """The recorded requests once at least count have arrived."""
+        with self.arrived:
+            if not self.arrived.wait_for(lambda: len(self.requests) >= count, timeout):
+                raise AssertionError(f"expected {count} requests, got {self.requests}")
+            return list(self.requests)
+
+    def close(self):
+        self.gate.set()
+        self.httpd.shutdown()
+        self.httpd.server_close()
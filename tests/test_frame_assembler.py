@@ -0,0 +1,124 @@
+# test_frame_assembler.py
+import random
+
+import pytest
+
+from packets import load_corpus
+
+LSD_Connect = pytest.importorskip("LSD_Connect")
+FrameAssembler = LSD_Connect.FrameAssembler
+
+CLEAR = "Command=LayoutDraw;Clear=2;"
+# Corpus packets that are exactly one frame, as the timing system would send them,
+# with a layout clear before every fifth
+FRAMES = []
+for i, raw in enumerate(raw for _, raw in load_corpus() if raw.endswith("\x05") and raw.count("\x05") == 1):
+    if i % 5 == 0:
+        FRAMES.append(CLEAR)
+    FRAMES.append(raw)
+STREAM = "".join(FRAMES).encode("utf-8")
+
+
+def replay(chunks):
+    """Feed chunks through one assembler as a connection would, flushing at close."""
+    assembler = FrameAssembler()
+    frames = []
+    for chunk in chunks:
+        frames.extend(assembler.feed(chunk))
+    return frames + assembler.flush()
+
+
+def test_one_segment_per_frame():
+    assert replay(frame.encode("utf-8") for frame in FRAMES) == FRAMES
+
+
+def test_frames_merged_into_one_segment():
+    assert replay([STREAM]) == FRAMES
+
+
+def test_stream_split_at_every_byte():
+    assert replay(STREAM[i:i + 1] for i in range(len(STREAM))) == FRAMES
+
+
+def test_random_segment_sizes():
+    rng = random.Random(16)
+    for _ in range(200):
+        chunks, start = [], 0
+        while start < len(STREAM):
+            size = rng.randint(1, 64)
+            chunks.append(STREAM[start:start + size])
+            start += size
+        assert replay(chunks) == FRAMES
+
+
+def test_multibyte_character_split_across_segments():
+    frame = "[2025-03-08 14:21:07] Dead heat – 1st\x05"
+    data = frame.encode("utf-8")
+    dash = data.index("–".encode("utf-8"))
+    for cut in (dash + 1, dash + 2):
+        assert replay([data[:cut], data[cut:]]) == [frame]
+
+
+def test_invalid_bytes_are_replaced():
+    assert replay([b"PHOTO \xff\x05"]) == ["PHOTO �\x05"]
+
+
+def test_trailing_text_flushed_on_close():
+    assert replay([b"Race: 3\x05LayoutDraw 1"]) == ["Race: 3\x05", "LayoutDraw 1"]
+
+
+def test_whitespace_left_at_close_is_not_a_frame():
+    assert replay([b"Race: 3\x05\r\n"]) == ["Race: 3\x05"]
+
+
+def test_partial_character_at_close_is_kept():
+    assert replay(["Margins –".encode("utf-8")[:-1]]) == ["Margins �"]
+
+
+def test_layout_draw_then_race_in_one_segment():
+    race = "Race: 5\r\nPlace:1 HorseID:3 Time:1:01.10\r\n\x05"
+    assert replay([(CLEAR + race).encode()]) == [CLEAR, race]
+
+
+def test_layout_draw_then_race_in_two_segments():
+    assembler = FrameAssembler()
+    assert assembler.feed(CLEAR.encode()) == []
+    assert assembler.feed(b"Race: 5\r\n\x05") == [CLEAR, "Race: 5\r\n\x05"]
+
+
+def test_layout_draw_waits_for_a_field_split_across_segments():
+    assert replay([b"Command=LayoutDraw;Cle", b"ar=2;Race: 5\x05"]) == [CLEAR, "Race: 5\x05"]
+
+
+def test_layout_draw_keeps_a_delimiter_that_follows_it():
+    assert replay([(CLEAR + "\r\n\x05Margins: HEAD\x05").encode()]) == [CLEAR + "\r\n\x05", "Margins: HEAD\x05"]
+
+
+def test_text_before_layout_draw_is_its_own_frame():
+    assert replay([("PHOTO" + CLEAR).encode()]) == ["PHOTO", CLEAR]
+
+
+def test_layout_draw_at_the_end_is_flushed_when_idle():
+    assembler = FrameAssembler()
+    assert assembler.feed(b"Race: 5\x05" + CLEAR.encode()) == ["Race: 5\x05"]
+    assembler.last_data -= LSD_Connect.FRAME_IDLE_SECONDS
+    assert assembler.flush_if_idle() == [CLEAR]
+
+
+def test_idle_flush():
+    assembler = FrameAssembler()
+    assert assembler.feed(b"LayoutDraw 1") == []
+    assert assembler.flush_if_idle() == []
+    assembler.last_data -= LSD_Connect.FRAME_IDLE_SECONDS
+    assert assembler.flush_if_idle() == ["LayoutDraw 1"]
+    assert assembler.flush_if_idle() == []
+
+
+def test_idle_flush_waits_for_quiet():
+    assembler = FrameAssembler()
+    assembler.feed(b"Race: 3\r\n")
+    assembler.last_data -= LSD_Connect.FRAME_IDLE_SECONDS
+    # New bytes restart the idle clock
+    assert assembler.feed(b"Place:1 HorseID:7") == []
+    assert assembler.flush_if_idle() == []
+    assert assembler.feed(b" Time:1:02.33\x05") == ["Race: 3\r\nPlace:1 HorseID:7 Time:1:02.33\x05"]
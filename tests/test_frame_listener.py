@@ -0,0 +1,91 @@
+# test_frame_listener.py
+"""Replay recorded packet streams at full speed over several connections at once."""
+import random
+import socket
+import threading
+import time
+
+import pytest
+
+from test_frame_assembler import CLEAR, FRAMES
+
+LSD_Connect = pytest.importorskip("LSD_Connect")
+
+CONNECTIONS = 8
+REPEATS = 20
+
+
+def connection_frames(connection: int) -> list:
+    """The frames one timing system sends, each tagged with its connection and position."""
+    frames = []
+    for repeat in range(REPEATS):
+        for i, frame in enumerate(FRAMES):
+            frames.append(frame if frame == CLEAR else f"<{connection}:{repeat}:{i}>{frame}")
+    return frames
+
+
+def fire(port: int, connection: int, tail: str):
+    """Send a connection's frames in random segment sizes, then tail with no delimiter, then close."""
+    data = ("".join(connection_frames(connection)) + tail).encode("utf-8")
+    rng = random.Random(connection)
+    with socket.create_connection(("127.0.0.1", port)) as client:
+        start = 0
+        while start < len(data):
+            size = rng.randint(1, 1500)
+            client.sendall(data[start:start + size])
+            start += size
+
+
+@pytest.fixture
+def listener():
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    server_socket.bind(("127.0.0.1", 0))
+    server_socket.listen(LSD_Connect.TCP_BACKLOG)
+    listener = LSD_Connect.FrameListener(server_socket)
+    yield listener
+    listener.close()
+    server_socket.close()
+
+
+def collect(listener, count: int, timeout: float = 20.0) -> list:
+    frames = []
+    deadline = time.time() + timeout
+    while len(frames) < count and time.time() < deadline:
+        frames.extend(listener.poll(timeout=0.05))
+    return frames
+
+
+def test_concurrent_connections_lose_nothing_and_keep_order(listener):
+    port = listener.server_socket.getsockname()[1]
+    tails = [f"<{connection}:tail>{CLEAR}" for connection in range(CONNECTIONS)]
+    clients = [threading.Thread(target=fire, args=(port, connection, tails[connection])) for connection in range(CONNECTIONS)]
+    for client in clients:
+        client.start()
+
+    expected = {connection: connection_frames(connection) for connection in range(CONNECTIONS)}
+    # Each tail is a tagged text frame followed by a command, both only complete at close
+    total = sum(len(frames) for frames in expected.values()) + 2 * CONNECTIONS
+    started = time.perf_counter()
+    frames = collect(listener, total)
+    elapsed = time.perf_counter() - started
+    for client in clients:
+        client.join()
+
+    assert len(frames) == total
+    for connection in range(CONNECTIONS):
+        tag = f"<{connection}:"
+        tagged = [frame for frame in frames if frame.startswith(tag)]
+        assert tagged == [frame for frame in expected[connection] if frame != CLEAR] + [f"<{connection}:tail>"]
+    commands = sum(frames.count(CLEAR) for frames in expected.values()) + CONNECTIONS
+    assert frames.count(CLEAR) == commands
+    print(f"{total} frames over {CONNECTIONS} connections in {elapsed * 1000:.0f} ms")
+
+
+def test_open_connection_is_flushed_when_idle(listener):
+    port = listener.server_socket.getsockname()[1]
+    with socket.create_connection(("127.0.0.1", port)) as client:
+        client.sendall(b"Race: 5\x05LayoutDraw 1")
+        frames = collect(listener, 1)
+        assert frames == ["Race: 5\x05"]
+        frames = collect(listener, 1, timeout=2 * LSD_Connect.FRAME_IDLE_SECONDS + 1)
+        assert frames == ["LayoutDraw 1"]
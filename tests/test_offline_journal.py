@@ -0,0 +1,110 @@
+# test_offline_journal.py
+import json
+
+import pytest
+
+from packets import FORM_ONLY, MARGINS, MARGINS_2, RACE_4, RACE_5, RACE_5_RUNNING
+from stub_server import StubServer
+
+LSD_Connect = pytest.importorskip("LSD_Connect")
+OfflineJournal = LSD_Connect.OfflineJournal
+
+PATH = "/submit/1"
+INIT = "/initialise/1"
+
+
+def entry(payload, path=PATH):
+    return {"path": path, "payload": payload}
+
+
+@pytest.fixture
+def journal(tmp_path):
+    return OfflineJournal(str(tmp_path / "outbox.jsonl"))
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def sender(stub, journal, tmp_path, monkeypatch):
+    """A sender whose worker has stopped, so the test drives flush_journal itself."""
+    monkeypatch.setattr(LSD_Connect, "LOG_FILE", str(tmp_path / "error.log"))
+    sender = LSD_Connect.OutboundSender(base_url=stub.url, journal=journal)
+    sender.stop()
+    return sender
+
+
+def test_append_and_load_in_order(journal):
+    journal.append(PATH, RACE_4)
+    journal.append(INIT, None)
+    assert journal.load() == [entry(RACE_4), entry(None, INIT)]
+    assert len(journal) == 2
+    assert len(OfflineJournal(journal.path)) == 2
+
+
+def test_torn_line_is_skipped(journal):
+    journal.append(PATH, RACE_4)
+    with open(journal.path, "a") as f:
+        f.write('{"path": "/submit/1", "payl')
+    assert journal.load() == [entry(RACE_4)]
+
+
+def test_compact_keeps_a_result_and_margins_per_race():
+    entries = [entry(RACE_4), entry(RACE_5_RUNNING), entry(MARGINS), entry(RACE_5), entry(FORM_ONLY), entry(MARGINS_2)]
+    assert OfflineJournal.compact(entries) == [entry(RACE_4), entry(RACE_5), entry(MARGINS_2)]
+
+
+def test_compact_keeps_every_initialise():
+    entries = [entry(None, INIT), entry(MARGINS), entry(None, INIT), entry(MARGINS_2)]
+    assert OfflineJournal.compact(entries) == [entry(None, INIT), entry(None, INIT), entry(MARGINS_2)]
+
+
+def test_compact_is_per_club():
+    entries = [entry(MARGINS), entry(MARGINS_2, "/submit/2")]
+    assert OfflineJournal.compact(entries) == entries
+
+
+def test_cap_compacts_then_keeps_the_newest(tmp_path):
+    journal = OfflineJournal(str(tmp_path / "outbox.jsonl"), max_entries=3)
+    journal.append(PATH, MARGINS)
+    journal.append(PATH, RACE_4)
+    journal.append(PATH, MARGINS_2)
+    journal.append(PATH, RACE_5)
+    # The older margins message is superseded, so nothing real is lost
+    assert journal.load() == [entry(RACE_4), entry(MARGINS_2), entry(RACE_5)]
+    assert len(journal) == 3
+    for race in range(6, 9):
+        journal.append(PATH, dict(RACE_5, raw_message=f"Race: {race}\r\n\x05"))
+    assert len(journal) == 3
+    assert [json.loads(line)["payload"]["raw_message"] for line in open(journal.path)][-1] == "Race: 8\r\n\x05"
+
+
+def test_flush_replays_runs_of_submits_as_batches(stub, journal, sender):
+    for path, payload in [(PATH, RACE_4), (PATH, RACE_5), (PATH, MARGINS), (INIT, None), (PATH, FORM_ONLY)]:
+        journal.append(path, payload)
+    assert sender.flush_journal() == 5
+    assert [(path, body) for path, body, _ in stub.requests] == [
+        (PATH + "/batch", [RACE_4, RACE_5, MARGINS]),
+        (INIT, None),
+        (PATH, FORM_ONLY),
+    ]
+    assert journal.load() == []
+    assert not sender.offline
+
+
+def test_flush_keeps_the_rest_when_the_server_goes_away(stub, journal, sender):
+    for path, payload in [(PATH, RACE_4), (PATH, MARGINS), (INIT, None), (PATH, RACE_5)]:
+        journal.append(path, payload)
+    stub.statuses = [200, 503]
+    assert sender.flush_journal() == 2
+    assert journal.load() == [entry(None, INIT), entry(RACE_5)]
+    assert len(journal) == 2
+    assert sender.offline
+
+    assert sender.flush_journal() == 2
+    assert journal.load() == []
+    assert [path for path, _, _ in stub.requests] == [PATH + "/batch", INIT, INIT, PATH]
@@ -0,0 +1,156 @@
+# test_outbound_sender.py
+import time
+
+import pytest
+
+from packets import FORM_ONLY, MARGINS, MARGINS_2, RACE_4, RACE_5, RACE_5_RUNNING, submit
+from stub_server import StubServer
+
+LSD_Connect = pytest.importorskip("LSD_Connect")
+
+PATH = "/submit/1"
+
+
+@pytest.fixture
+def idle_sender(tmp_path):
+    """A sender whose worker has stopped, so queued jobs stay put for inspection."""
+    sender = LSD_Connect.OutboundSender(
+        base_url="http://127.0.0.1:9", journal=LSD_Connect.OfflineJournal(str(tmp_path / "outbox.jsonl"))
+    )
+    sender.stop()
+    return sender
+
+
+def wait_until(condition, timeout=5.0):
+    deadline = time.time() + timeout
+    while not condition():
+        assert time.time() < deadline, "timed out"
+        time.sleep(0.01)
+
+
+def queued(sender):
+    return [payload for _, payload, _, _ in sender.queue]
+
+
+def test_frame_key():
+    assert LSD_Connect.frame_key(RACE_5) == ("race", "5")
+    assert LSD_Connect.frame_key(submit("Race: 1\r2\r\n\x05")) == ("race", "12")
+    assert LSD_Connect.frame_key(MARGINS) == ("message",)
+    assert LSD_Connect.frame_key(FORM_ONLY) is None
+    assert LSD_Connect.frame_key(submit("Race: \r\n\x05")) is None
+
+
+def test_newer_frame_of_the_same_kind_replaces_a_queued_one(idle_sender):
+    idle_sender.enqueue(PATH, RACE_5_RUNNING)
+    idle_sender.enqueue(PATH, RACE_5)
+    idle_sender.enqueue(PATH, MARGINS)
+    idle_sender.enqueue(PATH, MARGINS_2)
+    assert queued(idle_sender) == [RACE_5, MARGINS_2]
+    assert idle_sender.collapsed == 2
+
+
+def test_race_result_survives_a_margins_frame(idle_sender):
+    idle_sender.enqueue(PATH, RACE_5)
+    idle_sender.enqueue(PATH, MARGINS)
+    assert queued(idle_sender) == [RACE_5, MARGINS]
+
+
+def test_next_race_does_not_replace_the_last_result(idle_sender):
+    idle_sender.enqueue(PATH, RACE_4)
+    idle_sender.enqueue(PATH, RACE_5)
+    assert queued(idle_sender) == [RACE_4, RACE_5]
+
+
+def test_form_only_submits_are_replaced_by_anything_newer(idle_sender):
+    idle_sender.enqueue(PATH, FORM_ONLY)
+    idle_sender.enqueue(PATH, MARGINS)
+    assert queued(idle_sender) == [MARGINS]
+    idle_sender.enqueue(PATH, FORM_ONLY)
+    assert queued(idle_sender) == [MARGINS, FORM_ONLY]
+
+
+def test_initialise_keeps_its_place(idle_sender):
+    idle_sender.enqueue(PATH, MARGINS)
+    idle_sender.enqueue("/initialise/1")
+    idle_sender.enqueue(PATH, MARGINS_2)
+    assert [path for path, _, _, _ in idle_sender.queue] == ["/initialise/1", PATH]
+
+
+def test_backlog_goes_out_as_one_batch_up_to_an_initialise():
+    jobs = [(PATH, RACE_4), (PATH, RACE_5), (PATH, MARGINS), ("/initialise/1", None), (PATH, MARGINS_2)]
+    assert LSD_Connect.batch_length(jobs) == 3
+    assert LSD_Connect.batch_length(jobs[3:]) == 1
+    assert LSD_Connect.batch_length(jobs[4:]) == 1
+
+
+@pytest.fixture
+def stub():
+    server = StubServer()
+    yield server
+    server.close()
+
+
+@pytest.fixture
+def sender(stub, tmp_path, monkeypatch):
+    monkeypatch.setattr(LSD_Connect, "LOG_FILE", str(tmp_path / "error.log"))
+    sender = LSD_Connect.OutboundSender(
+        base_url=stub.url, journal=LSD_Connect.OfflineJournal(str(tmp_path / "outbox.jsonl"))
+    )
+    yield sender
+    sender.stop()
+
+
+def test_updates_reuse_one_keep_alive_connection(stub, sender):
+    for i in range(20):
+        sender.enqueue(PATH, submit(f"Race: {i + 1}\r\n\x05"))
+        stub.wait_for(i + 1)
+    wait_until(lambda: sender.sent == 20)
+    ports = {port for _, _, port in stub.requests}
+    assert len(ports) == 1
+    # Packet-to-server latency against a local server: well under a new TLS handshake
+    assert sender.last_latency is not None and sender.last_latency < 0.5
+
+
+def test_frames_queued_behind_an_inflight_submit_all_arrive_in_order(stub, sender):
+    stub.hold()
+    sender.enqueue(PATH, RACE_4)
+    stub.wait_for(1)
+    sender.enqueue(PATH, RACE_5_RUNNING)
+    sender.enqueue(PATH, RACE_5)
+    sender.enqueue(PATH, MARGINS)
+    stub.release()
+    requests = stub.wait_for(2)
+    assert [(path, body) for path, body, _ in requests] == [
+        (PATH, RACE_4),
+        (PATH + "/batch", [RACE_5, MARGINS]),
+    ]
+
+
+def test_throttled_result_is_resent_when_only_a_margins_frame_is_queued(stub, sender):
+    stub.hold()
+    stub.statuses = [429]
+    sender.enqueue(PATH, RACE_5)
+    stub.wait_for(1)
+    sender.enqueue(PATH, MARGINS)
+    stub.release()
+    requests = stub.wait_for(3)
+    assert [(path, body) for path, body, _ in requests] == [(PATH, RACE_5), (PATH, RACE_5), (PATH, MARGINS)]
+    assert sender.throttled == 1
+
+
+def test_throttled_submit_is_dropped_when_a_newer_one_replaces_it(stub, sender):
+    stub.hold()
+    stub.statuses = [429]
+    sender.enqueue(PATH, MARGINS)
+    stub.wait_for(1)
+    sender.enqueue(PATH, MARGINS_2)
+    stub.release()
+    requests = stub.wait_for(2)
+    assert [(path, body) for path, body, _ in requests] == [(PATH, MARGINS), (PATH, MARGINS_2)]
+
+
+def test_throttled_batch_resends_only_what_is_not_replaced(idle_sender):
+    idle_sender.enqueue(PATH, MARGINS_2)
+    assert idle_sender.unsent(PATH, [RACE_5, MARGINS]) == [RACE_5]
+    assert idle_sender.unsent(PATH, [MARGINS]) is None
+    assert idle_sender.unsent(PATH, RACE_5) == RACE_5
@@ -0,0 +1,39 @@
+# test_parsing.py
+import pytest
+
+import legacy_parsing
+from packets import load_corpus, random_packets
+from parsing import parse_raw_message
+
+CORPUS = load_corpus()
+
+
+def _as_legacy(raw: str):
+    parsed = parse_raw_message(raw)
+    return parsed.race_no, parsed.runner_lines, parsed.message1
+
+
+@pytest.mark.parametrize("raw", [raw for _, raw in CORPUS], ids=[note for note, _ in CORPUS])
+def test_corpus_matches_legacy_parser(raw):
+    assert _as_legacy(raw) == legacy_parsing.parse_raw_message(raw)
+
+
+def test_random_packets_match_legacy_parser():
+    for raw in random_packets(5000):
+        assert _as_legacy(raw) == legacy_parsing.parse_raw_message(raw), repr(raw)
+
+
+def test_runners_keep_their_places():
+    parsed = parse_raw_message("Race: 3\r\nPlace:1 HorseID:7 Time:1:02.33\r\nPlace: HorseID:4 Time:\x05")
+    assert parsed.race_no == "3"
+    assert parsed.runners == [("1", "7", "1:02.33"), ("", "4", "")]
+    assert parsed.runner_lines == ["7 - 1:02.33", "4 - —"]
+
+
+def test_race_digits_split_by_carriage_return_are_joined():
+    assert parse_raw_message("Race: 1\r2\r\nPlace:1 HorseID:3 Time:1:10.00\x05").race_no == "12"
+
+
+def test_message_only_frame():
+    parsed = parse_raw_message("[2025-03-08 14:21:07] Margins: 1/2 LEN, HEAD\x05")
+    assert parsed == (None, [], "Margins: 1/2 LEN, HEAD")